@@ -0,0 +1,39 @@
+"""add link_request_tokens created_at index
+
+Revision ID: d863c49a46d4
+Revises: 931e45c18b3a
+Create Date: 2026-10-17 16:20:05.412087
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d863c49a46d4"
+down_revision: Union[str, None] = "931e45c18b3a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 既存の行が多くても書き込みを止めないよう、CONCURRENTLYで作成する
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_link_request_tokens_created_at"),
+            "link_request_tokens",
+            ["created_at"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f("ix_link_request_tokens_created_at"),
+            table_name="link_request_tokens",
+            postgresql_concurrently=True,
+        )
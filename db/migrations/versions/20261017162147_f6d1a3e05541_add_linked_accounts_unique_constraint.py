@@ -0,0 +1,50 @@
+"""add linked_accounts unique constraint
+
+Revision ID: f6d1a3e05541
+Revises: d863c49a46d4
+Create Date: 2026-10-17 16:21:47.208314
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f6d1a3e05541"
+down_revision: Union[str, None] = "d863c49a46d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 重複した連携があれば、有効なもの(なければ最も古いもの)を残して削除する
+    op.execute(
+        """
+        DELETE FROM linked_accounts
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT
+                    id,
+                    row_number() OVER (
+                        PARTITION BY discord_id, wikidot_id
+                        ORDER BY unlinked_at IS NOT NULL, id
+                    ) AS rn
+                FROM linked_accounts
+            ) AS t
+            WHERE t.rn > 1
+        )
+        """
+    )
+    op.create_unique_constraint(
+        "uq_linked_accounts_discord_id_wikidot_id",
+        "linked_accounts",
+        ["discord_id", "wikidot_id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(
+        "uq_linked_accounts_discord_id_wikidot_id", "linked_accounts", type_="unique"
+    )
@@ -0,0 +1,137 @@
+"""add link_changes table
+
+Revision ID: ff947cba8b3c
+Revises: f6d1a3e05541
+Create Date: 2026-10-17 16:24:37.530216
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "ff947cba8b3c"
+down_revision: Union[str, None] = "f6d1a3e05541"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "link_changes",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("kind", sa.String(length=32), nullable=False),
+        sa.Column("discord_id", sa.BigInteger(), nullable=True),
+        sa.Column("wikidot_id", sa.Integer(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    # idの採番順とコミット順を揃えるため、記録するトランザクションを直列化する
+    # (後からコミットされた小さいidを、カーソルで読み飛ばさないようにする)
+    # ロックはコミットまで保持されるため、変更を記録する書き込み同士は並行しない
+    op.execute(
+        """
+        CREATE FUNCTION record_link_change(
+            p_kind text, p_discord_id bigint, p_wikidot_id integer
+        ) RETURNS void AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('link_changes'));
+            INSERT INTO link_changes (kind, discord_id, wikidot_id)
+            VALUES (p_kind, p_discord_id, p_wikidot_id);
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+    op.execute(
+        """
+        CREATE FUNCTION linked_accounts_record_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                IF NEW.unlinked_at IS NULL THEN
+                    PERFORM record_link_change('link', NEW.discord_id, NEW.wikidot_id);
+                END IF;
+            ELSIF TG_OP = 'DELETE' THEN
+                IF OLD.unlinked_at IS NULL THEN
+                    PERFORM record_link_change('unlink', OLD.discord_id, OLD.wikidot_id);
+                END IF;
+            ELSIF OLD.unlinked_at IS NULL AND NEW.unlinked_at IS NOT NULL THEN
+                PERFORM record_link_change('unlink', NEW.discord_id, NEW.wikidot_id);
+            ELSIF OLD.unlinked_at IS NOT NULL AND NEW.unlinked_at IS NULL THEN
+                PERFORM record_link_change('relink', NEW.discord_id, NEW.wikidot_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER linked_accounts_record_change
+        AFTER INSERT OR UPDATE OF unlinked_at OR DELETE ON linked_accounts
+        FOR EACH ROW EXECUTE FUNCTION linked_accounts_record_change()
+        """
+    )
+
+    op.execute(
+        """
+        CREATE FUNCTION wikidot_accounts_record_change() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.is_jp_member IS DISTINCT FROM OLD.is_jp_member THEN
+                PERFORM record_link_change('jp_member', NULL, NEW.wikidot_id);
+            END IF;
+            IF (NEW.username, NEW.unixname) IS DISTINCT FROM (OLD.username, OLD.unixname) THEN
+                PERFORM record_link_change('wikidot_profile', NULL, NEW.wikidot_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER wikidot_accounts_record_change
+        AFTER UPDATE OF is_jp_member, username, unixname ON wikidot_accounts
+        FOR EACH ROW EXECUTE FUNCTION wikidot_accounts_record_change()
+        """
+    )
+
+    op.execute(
+        """
+        CREATE FUNCTION discord_accounts_record_change() RETURNS trigger AS $$
+        BEGIN
+            IF (NEW.username, NEW.avatar) IS DISTINCT FROM (OLD.username, OLD.avatar) THEN
+                PERFORM record_link_change('discord_profile', NEW.discord_id, NULL);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER discord_accounts_record_change
+        AFTER UPDATE OF username, avatar ON discord_accounts
+        FOR EACH ROW EXECUTE FUNCTION discord_accounts_record_change()
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER discord_accounts_record_change ON discord_accounts")
+    op.execute("DROP FUNCTION discord_accounts_record_change()")
+    op.execute("DROP TRIGGER wikidot_accounts_record_change ON wikidot_accounts")
+    op.execute("DROP FUNCTION wikidot_accounts_record_change()")
+    op.execute("DROP TRIGGER linked_accounts_record_change ON linked_accounts")
+    op.execute("DROP FUNCTION linked_accounts_record_change()")
+    op.execute("DROP FUNCTION record_link_change(text, bigint, integer)")
+    op.drop_table("link_changes")
@@ -0,0 +1,56 @@
+"""add link_graph notify triggers
+
+Revision ID: ea56e457533a
+Revises: ff947cba8b3c
+Create Date: 2026-10-17 16:30:12.418206
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "ea56e457533a"
+down_revision: Union[str, None] = "ff947cba8b3c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ["discord_accounts", "wikidot_accounts", "linked_accounts"]
+
+
+def upgrade() -> None:
+    # 変更後(削除時は削除前)の行をそのまま通知する(通知はcommit時に配送される)
+    op.execute(
+        """
+        CREATE FUNCTION notify_link_graph() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify(
+                'link_graph',
+                json_build_object(
+                    'table', TG_TABLE_NAME,
+                    'op', TG_OP,
+                    'at', extract(epoch FROM clock_timestamp()),
+                    'row', row_to_json(CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END)
+                )::text
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for table in TABLES:
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_notify_link_graph
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION notify_link_graph()
+            """
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER {table}_notify_link_graph ON {table}")
+    op.execute("DROP FUNCTION notify_link_graph()")
@@ -0,0 +1,82 @@
+"""lock link_changes per statement
+
+Revision ID: 888c6d084933
+Revises: ea56e457533a
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "888c6d084933"
+down_revision: Union[str, None] = "ea56e457533a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 変更履歴を記録するテーブルと、記録の対象になる操作
+TRACKED = {
+    "linked_accounts": "INSERT OR UPDATE OF unlinked_at OR DELETE",
+    "wikidot_accounts": "UPDATE OF is_jp_member, username, unixname",
+    "discord_accounts": "UPDATE OF username, avatar",
+}
+
+
+def upgrade() -> None:
+    # 行トリガーの中でロックを取ると、先に行ロックを持ったトランザクションと
+    # 先にロックを持ったトランザクションが互いを待つ(デッドロック)ため、
+    # 文の開始時(行をロックする前)に1回だけ取る
+    op.execute(
+        """
+        CREATE FUNCTION lock_link_changes() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('link_changes'));
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for table, events in TRACKED.items():
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_lock_link_changes
+            BEFORE {events} ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION lock_link_changes()
+            """
+        )
+
+    # 行ごとの記録はロックを取らずに追記するだけにする
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION record_link_change(
+            p_kind text, p_discord_id bigint, p_wikidot_id integer
+        ) RETURNS void AS $$
+        BEGIN
+            INSERT INTO link_changes (kind, discord_id, wikidot_id)
+            VALUES (p_kind, p_discord_id, p_wikidot_id);
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION record_link_change(
+            p_kind text, p_discord_id bigint, p_wikidot_id integer
+        ) RETURNS void AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('link_changes'));
+            INSERT INTO link_changes (kind, discord_id, wikidot_id)
+            VALUES (p_kind, p_discord_id, p_wikidot_id);
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for table in TRACKED:
+        op.execute(f"DROP TRIGGER {table}_lock_link_changes ON {table}")
+    op.execute("DROP FUNCTION lock_link_changes()")
@@ -1,9 +1,13 @@
 import os
 
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from .histogram import LatencyHistogram
+from .pool import InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool
+
 
 def get_env(key: str, default: str) -> str:
     return os.environ.get(key, default)
@@ -16,8 +20,35 @@ POSTGRES_PASSWORD = get_env("POSTGRES_PASSWORD", "password")
 SQLALCHEMY_DATABASE_URL = (
     f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@db:5432/main"
 )
+ASYNC_SQLALCHEMY_DATABASE_URL = (
+    f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@db:5432/main"
+)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# connection pool
+POOL_OPTIONS = {
+    "pool_size": int(get_env("DB_POOL_SIZE", "5")),
+    "max_overflow": int(get_env("DB_POOL_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(get_env("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(get_env("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": get_env("DB_POOL_PRE_PING", "true").lower() == "true",
+}
+
+# sync: threadpoolで動くルート・バックグラウンドタスク・マイグレーション用
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, poolclass=InstrumentedQueuePool, **POOL_OPTIONS
+)
+engine.pool.stats = LatencyHistogram()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# async: async defのルート用
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    poolclass=InstrumentedAsyncAdaptedQueuePool,
+    **POOL_OPTIONS,
+)
+async_engine.pool.stats = LatencyHistogram()
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=async_engine
+)
+
 Base = declarative_base()
@@ -0,0 +1,45 @@
+import asyncio
+import logging
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# 変更通知を受け取るリスナー(kind, discord_ids, wikidot_ids)
+ChangeListener = Callable[[str, list[int], list[int]], None]
+
+_listeners: list[ChangeListener] = []
+
+
+def add_change_listener(listener: ChangeListener) -> ChangeListener:
+    """アカウント・連携情報の変更(commit後)を受け取るリスナーを登録する"""
+    _listeners.append(listener)
+    return listener
+
+
+def notify_change(
+    kind: str, discord_ids: Iterable[int] = (), wikidot_ids: Iterable[int] = ()
+) -> None:
+    """
+    アカウント・連携情報が変更されたことを通知する
+
+    kind: link / unlink / relink / discord_profile / wikidot_profile / jp_member
+    """
+    discord_ids = [int(i) for i in discord_ids]
+    wikidot_ids = [int(i) for i in wikidot_ids]
+    for listener in _listeners:
+        # commit済みの書き込みをリスナーの失敗で巻き戻さない
+        try:
+            listener(kind, discord_ids, wikidot_ids)
+        except Exception as e:
+            logger.error(f"change listener failed: {e}")
+
+
+async def notify_change_async(
+    kind: str, discord_ids: Iterable[int] = (), wikidot_ids: Iterable[int] = ()
+) -> None:
+    """
+    async defの中から変更を通知する
+
+    リスナーはブロッキングなI/O(Redis)を行うため、イベントループを止めないようスレッドで実行する
+    """
+    await asyncio.to_thread(notify_change, kind, list(discord_ids), list(wikidot_ids))
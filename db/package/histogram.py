@@ -0,0 +1,46 @@
+import threading
+
+# ヒストグラムのバケット上限(ms)
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class LatencyHistogram:
+    """
+    所要時間(ms)とタイムアウトの回数を集計する
+
+    コネクションプールのチェックアウト待ち時間や、外部APIの応答時間に使う
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.timeouts = 0
+
+    def observe(self, elapsed_ms: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            for i, upper in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= upper:
+                    self.buckets[i] += 1
+                    break
+            else:
+                self.buckets[-1] += 1
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = [f"le_{upper}ms" for upper in LATENCY_BUCKETS_MS] + ["inf"]
+            return {
+                "count": self.count,
+                "timeouts": self.timeouts,
+                "avg_ms": self.total_ms / self.count if self.count else 0.0,
+                "max_ms": self.max_ms,
+                "histogram": dict(zip(labels, self.buckets)),
+            }
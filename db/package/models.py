@@ -1,7 +1,15 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Integer, String, DateTime, ForeignKey, BigInteger, Boolean
+from sqlalchemy import (
+    Integer,
+    String,
+    DateTime,
+    ForeignKey,
+    BigInteger,
+    Boolean,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import text
 
@@ -70,6 +78,11 @@ class WikidotAccount(Base):
 
 class LinkedAccount(Base):
     __tablename__ = "linked_accounts"
+    __table_args__ = (
+        UniqueConstraint(
+            "discord_id", "wikidot_id", name="uq_linked_accounts_discord_id_wikidot_id"
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     discord_id: Mapped[int] = mapped_column(
@@ -106,7 +119,7 @@ class LinkRequestToken(Base):
         Integer, ForeignKey("discord_accounts.id", ondelete="CASCADE"), index=True
     )
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), server_default=text("now()")
+        DateTime(timezone=True), server_default=text("now()"), index=True
     )
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=text("now()"), onupdate=text("now()")
@@ -115,3 +128,24 @@ class LinkRequestToken(Base):
     discord: Mapped["DiscordAccount"] = relationship(
         back_populates="link_request_tokens"
     )
+
+
+class LinkChange(Base):
+    """
+    連携状態の変更履歴(トリガーで追記され、保持期間を過ぎたものはlink_changes_prunerが消す)
+
+    idの採番順とコミット順を揃えるため、記録の対象になる文は開始時(行をロックする前)に
+    pg_advisory_xact_lockを取る。連携・プロフィールを変更する書き込みは
+    コミットまでこのロックを持つため、同時に書き込めるのは1トランザクションずつになる
+    (書き込みの同時実行数を上げる場合は、順序付けをコミットLSNなどに変える)
+    """
+
+    __tablename__ = "link_changes"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(32))
+    discord_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    wikidot_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=text("now()")
+    )
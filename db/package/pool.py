@@ -0,0 +1,57 @@
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .histogram import LatencyHistogram
+
+
+class _WaitTimingMixin:
+    """_do_getの所要時間をチェックアウト待ち時間として記録する"""
+
+    stats: LatencyHistogram | None = None
+
+    def __init__(self, *args, max_overflow: int = 10, **kwargs):
+        # QueuePoolの_max_overflowは非公開のため、受け取った値を自分で持っておく
+        # (recreateも同じ値で__init__を呼び直す)
+        self.max_overflow = max_overflow
+        super().__init__(*args, max_overflow=max_overflow, **kwargs)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            if self.stats is not None:
+                self.stats.observe(0, timed_out=True)
+            raise
+        if self.stats is not None:
+            self.stats.observe((time.perf_counter() - start) * 1000)
+        return conn
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class InstrumentedQueuePool(_WaitTimingMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_WaitTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def get_pool_status(pool: QueuePool) -> dict:
+    """プールの現在の使用状況と待ち時間の統計を返す"""
+    stats = getattr(pool, "stats", None)
+    max_overflow = getattr(pool, "max_overflow", None)
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": max_overflow,
+        "wait": stats.snapshot() if stats is not None else None,
+    }
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class DiscordAccountSchema(BaseModel):
@@ -75,6 +75,18 @@ class AccountListResponseSchema(BaseModel):
     result: dict[str, AccountResponseFromDiscordSchema]
 
 
+class AccountListByWikidotRequestSchema(BaseModel):
+    """Wikidot IDからのAccountCheckのリクエスト"""
+
+    wikidot_ids: list[int] = Field(max_length=10000)
+
+
+class AccountListByWikidotResponseSchema(BaseModel):
+    """Wikidot IDからのAccountCheckのレスポンス"""
+
+    result: dict[str, AccountResponseFromWikidotSchema]
+
+
 class DiscordAccountSchemaForManage(DiscordAccountSchema):
     """Discordアカウントの管理用スキーマ"""
 
@@ -102,6 +114,7 @@ class ListDiscordResponseSchema(BaseModel):
     """Discordアカウントのリスト"""
 
     result: list[ListDiscordItemSchema]
+    next_cursor: int | None = None
 
 
 class ListWikidotItemSchema(BaseModel):
@@ -115,6 +128,7 @@ class ListWikidotResponseSchema(BaseModel):
     """Wikidotアカウントのリスト"""
 
     result: list[ListWikidotItemSchema]
+    next_cursor: int | None = None
 
 
 class UnlinkResponseSchema(BaseModel):
@@ -127,3 +141,46 @@ class RelinkResponseSchema(BaseModel):
     """Relinkのレスポンス"""
 
     result: bool
+
+
+class LinkPairSchema(BaseModel):
+    """連携のペア"""
+
+    discord_id: int
+    wikidot_id: int
+
+
+class BulkLinkRequestSchema(BaseModel):
+    """Unlink/Relinkの一括リクエスト"""
+
+    pairs: list[LinkPairSchema] = Field(max_length=1000)
+
+
+class BulkLinkResultSchema(LinkPairSchema):
+    """Unlink/Relinkの一括リクエストのペアごとの結果"""
+
+    result: bool
+
+
+class BulkLinkResponseSchema(BaseModel):
+    """Unlink/Relinkの一括リクエストのレスポンス"""
+
+    result: list[BulkLinkResultSchema]
+
+
+class LinkChangeSchema(BaseModel):
+    """連携状態の変更履歴の要素"""
+
+    id: int
+    kind: str
+    discord_id: str | None
+    wikidot_id: int | None
+    created_at: datetime
+
+
+class LinkChangesResponseSchema(BaseModel):
+    """連携状態の変更履歴"""
+
+    result: list[LinkChangeSchema]
+    next_cursor: int
+    has_more: bool
@@ -1,6 +1,6 @@
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 
-from .connection import SessionLocal
+from .connection import AsyncSessionLocal, SessionLocal
 
 
 def db_context():
@@ -14,4 +14,16 @@ def db_context():
         db.close()
 
 
+async def async_db_context():
+    db = AsyncSessionLocal()
+    try:
+        yield db
+    except Exception as e:
+        await db.rollback()
+        raise e
+    finally:
+        await db.close()
+
+
 get_db = contextmanager(db_context)
+get_async_db = asynccontextmanager(async_db_context)
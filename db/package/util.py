@@ -1,71 +1,395 @@
-import secrets
-from datetime import datetime, timedelta
+import asyncio
+import os
+from datetime import datetime
+from typing import Protocol
 
-import wikidot
-from sqlalchemy import select, ScalarResult
+from sqlalchemy import (
+    and_,
+    Boolean,
+    case,
+    cast,
+    column,
+    delete,
+    func,
+    Integer,
+    literal,
+    literal_column,
+    or_,
+    select,
+    Select,
+    Text,
+    tuple_,
+    union_all,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
 
 from . import schemas
-from .models import DiscordAccount, WikidotAccount, LinkedAccount, LinkRequestToken
+from .events import notify_change, notify_change_async
+from .models import (
+    DiscordAccount,
+    WikidotAccount,
+    LinkedAccount,
+    LinkRequestToken,
+    LinkChange,
+)
 
 
-class IOUtil:
-    @staticmethod
-    def get_discord_account(db: Session, discord_id: int) -> DiscordAccount | None:
-        return (
-            db.execute(
-                select(DiscordAccount)
-                .options(
-                    joinedload(DiscordAccount.linked_accounts).joinedload(
-                        LinkedAccount.wikidot
-                    )
-                )
-                .where(DiscordAccount.discord_id == discord_id)
+class MemberLookup(Protocol):
+    """scp-jpのメンバー照会(wikidot.Siteやサーバー側の共有クライアント)"""
+
+    def member_lookup(self, user_name: str, user_id: int | None = None) -> bool: ...
+
+
+# Wikidotへのメンバー照会の同時実行数
+JP_MEMBER_LOOKUP_CONCURRENCY = int(os.environ.get("JP_MEMBER_LOOKUP_CONCURRENCY", 4))
+
+
+def _paginate(stmt: Select, pk, limit: int | None, after: int | None) -> Select:
+    """idをキーにしたkeyset paginationを適用する"""
+    stmt = stmt.order_by(pk)
+    if after is not None:
+        stmt = stmt.where(pk > after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def _discord_filters(
+    is_jp_member: bool | None = None, has_active_link: bool | None = None
+) -> list:
+    active_link = LinkedAccount.unlinked_at.is_(None)
+    filters = []
+
+    # 有効な連携先にJPメンバーがいるかどうか
+    if is_jp_member is not None:
+        cond = DiscordAccount.linked_accounts.any(
+            and_(
+                active_link,
+                LinkedAccount.wikidot.has(WikidotAccount.is_jp_member.is_(True)),
             )
-            .scalars()
-            .first()
         )
+        filters.append(cond if is_jp_member else ~cond)
 
-    @staticmethod
-    def get_some_discord_accounts(
-        db: Session, discord_ids: list[int]
-    ) -> ScalarResult[DiscordAccount]:
-        return (
-            db.execute(
-                select(DiscordAccount)
-                .options(
-                    joinedload(DiscordAccount.linked_accounts).joinedload(
-                        LinkedAccount.wikidot
-                    )
-                )
-                .where(DiscordAccount.discord_id.in_(discord_ids))
-            )
-            .scalars()
-            .unique()
+    if has_active_link is not None:
+        cond = DiscordAccount.linked_accounts.any(active_link)
+        filters.append(cond if has_active_link else ~cond)
+
+    return filters
+
+
+def _wikidot_filters(
+    is_jp_member: bool | None = None, has_active_link: bool | None = None
+) -> list:
+    filters = []
+
+    if is_jp_member is not None:
+        filters.append(WikidotAccount.is_jp_member.is_(is_jp_member))
+
+    if has_active_link is not None:
+        cond = WikidotAccount.linked_accounts.any(LinkedAccount.unlinked_at.is_(None))
+        filters.append(cond if has_active_link else ~cond)
+
+    return filters
+
+
+def _key(name: str):
+    """json_build_objectのキー(型が決まるようSQLのリテラルとして埋め込む)"""
+    return literal_column(f"'{name}'")
+
+
+def _json_array_agg(obj, order_by, cond):
+    """連携が無い場合は[]になるjson_agg"""
+    return func.coalesce(
+        func.json_agg(aggregate_order_by(obj, order_by)).filter(cond),
+        literal_column("'[]'::json"),
+    )
+
+
+def _discord_accounts_json_query(
+    base: Select, include_unlinked: bool, with_link_dates: bool
+) -> Select:
+    """
+    Discordアカウントごとに、レスポンスの要素をPostgres側でJSON文字列にする
+
+    base: 対象のdiscord_accountsを絞り込んだselect(id, discord_id, username, avatar)
+    """
+    d = base.subquery()
+    la = LinkedAccount.__table__.alias("la")
+    wa = WikidotAccount.__table__.alias("wa")
+
+    join_cond = la.c.discord_id == d.c.discord_id
+    if not include_unlinked:
+        join_cond = and_(join_cond, la.c.unlinked_at.is_(None))
+
+    wikidot_fields = [
+        _key("id"),
+        wa.c.wikidot_id,
+        _key("username"),
+        wa.c.username,
+        _key("unixname"),
+        wa.c.unixname,
+        _key("is_jp_member"),
+        wa.c.is_jp_member,
+    ]
+    if with_link_dates:
+        wikidot_fields += [
+            _key("created_at"),
+            la.c.created_at,
+            _key("updated_at"),
+            la.c.updated_at,
+            _key("unlinked_at"),
+            la.c.unlinked_at,
+        ]
+
+    obj = func.json_build_object(
+        _key("discord"),
+        func.json_build_object(
+            _key("id"),
+            cast(d.c.discord_id, Text),
+            _key("username"),
+            d.c.username,
+            _key("avatar"),
+            d.c.avatar,
+        ),
+        _key("wikidot"),
+        _json_array_agg(
+            func.json_build_object(*wikidot_fields), la.c.id, wa.c.id.is_not(None)
+        ),
+    )
+
+    # キャッシュの無効化用に、有効な連携先のwikidot_idも返す
+    wikidot_ids = func.array_remove(
+        func.array_agg(case((la.c.unlinked_at.is_(None), wa.c.wikidot_id), else_=None)),
+        None,
+    )
+
+    return (
+        select(d.c.id, d.c.discord_id, cast(obj, Text), wikidot_ids)
+        .select_from(
+            d.outerjoin(la, join_cond).outerjoin(wa, wa.c.wikidot_id == la.c.wikidot_id)
         )
+        .group_by(d.c.id, d.c.discord_id, d.c.username, d.c.avatar)
+        .order_by(d.c.id)
+    )
 
-    @staticmethod
-    def create_discord_account(
-        db: Session, acc: schemas.DiscordAccountSchema
-    ) -> DiscordAccount:
-        discord = DiscordAccount(
-            discord_id=acc.id, username=acc.username, avatar=acc.avatar
+
+def _wikidot_accounts_json_query(
+    base: Select, include_unlinked: bool = True, with_link_dates: bool = True
+) -> Select:
+    """
+    Wikidotアカウントごとに、レスポンスの要素をPostgres側でJSON文字列にする
+
+    base: 対象のwikidot_accountsを絞り込んだselect(id, wikidot_id, username, unixname, is_jp_member)
+    """
+    w = base.subquery()
+    la = LinkedAccount.__table__.alias("la")
+    da = DiscordAccount.__table__.alias("da")
+
+    join_cond = la.c.wikidot_id == w.c.wikidot_id
+    if not include_unlinked:
+        join_cond = and_(join_cond, la.c.unlinked_at.is_(None))
+
+    discord_fields = [
+        _key("id"),
+        cast(da.c.discord_id, Text),
+        _key("username"),
+        da.c.username,
+        _key("avatar"),
+        da.c.avatar,
+    ]
+    if with_link_dates:
+        discord_fields += [
+            _key("created_at"),
+            la.c.created_at,
+            _key("updated_at"),
+            la.c.updated_at,
+            _key("unlinked_at"),
+            la.c.unlinked_at,
+        ]
+
+    obj = func.json_build_object(
+        _key("discord"),
+        _json_array_agg(
+            func.json_build_object(*discord_fields), la.c.id, da.c.id.is_not(None)
+        ),
+        _key("wikidot"),
+        func.json_build_object(
+            _key("id"),
+            w.c.wikidot_id,
+            _key("username"),
+            w.c.username,
+            _key("unixname"),
+            w.c.unixname,
+            _key("is_jp_member"),
+            w.c.is_jp_member,
+        ),
+    )
+
+    return (
+        select(w.c.id, w.c.wikidot_id, cast(obj, Text))
+        .select_from(
+            w.outerjoin(la, join_cond).outerjoin(da, da.c.discord_id == la.c.discord_id)
         )
-        db.add(discord)
-        db.commit()
-        db.refresh(discord)
-        return discord
+        .group_by(w.c.id, w.c.wikidot_id, w.c.username, w.c.unixname, w.c.is_jp_member)
+        .order_by(w.c.id)
+    )
+
+
+def _discord_account_query(discord_id: int) -> Select:
+    """連携先のWikidotアカウントまで読み込んだDiscordアカウント"""
+    return (
+        select(DiscordAccount)
+        .options(
+            joinedload(DiscordAccount.linked_accounts).joinedload(LinkedAccount.wikidot)
+        )
+        .where(DiscordAccount.discord_id == discord_id)
+    )
+
+
+def _link_changes_query(since: int, limit: int) -> Select:
+    """idがsinceより大きい変更履歴を古い順に"""
+    return (
+        select(LinkChange)
+        .where(LinkChange.id > since)
+        .order_by(LinkChange.id)
+        .limit(limit)
+    )
+
+
+def _upsert_discord_account_query(acc: schemas.DiscordAccountSchema) -> Select:
+    """
+    Discordアカウントのupsertを1文で行う
+
+    結果は1行(id, changed)。プロフィールが変わらなければ書き込まず、既存の行を返す
+    同じアカウントが同時に作成された場合は、文の開始時点で行が見えないため0行になる
+    """
+    stmt = pg_insert(DiscordAccount).values(
+        discord_id=int(acc.id), username=acc.username, avatar=acc.avatar
+    )
+    up = (
+        stmt.on_conflict_do_update(
+            index_elements=[DiscordAccount.discord_id],
+            set_={
+                "username": stmt.excluded.username,
+                "avatar": stmt.excluded.avatar,
+                "updated_at": func.now(),
+            },
+            where=or_(
+                DiscordAccount.username.is_distinct_from(stmt.excluded.username),
+                DiscordAccount.avatar.is_distinct_from(stmt.excluded.avatar),
+            ),
+        )
+        .returning(DiscordAccount.id, literal(True).label("changed"))
+        .cte("up")
+    )
+
+    # upsertで行が返らない(変更なし)場合は、文の開始時点の行を返す
+    existing = select(DiscordAccount.id, literal(False).label("changed")).where(
+        DiscordAccount.discord_id == int(acc.id),
+        ~select(up.c.id).exists(),
+    )
+
+    return union_all(select(up.c.id, up.c.changed), existing)
+
+
+def _discord_account_id_query(discord_id: int) -> Select:
+    return select(DiscordAccount.id).where(DiscordAccount.discord_id == discord_id)
+
+
+def _link_accounts_query(discord_id: int, acc: schemas.WikidotAccountSchema) -> Select:
+    """
+    Wikidotアカウントのupsertと連携のupsertを1文で行う
+
+    結果はDiscordアカウントが存在するときのみ1行(discord_username, discord_avatar, wikidot_inserted, link_inserted)
+    wikidot_inserted: 新規ならTrue、プロフィール更新ならFalse、変更なしならNULL
+    link_inserted: 新規ならTrue、再連携ならFalse、連携済みならNULL
+    """
+    # 行が新規作成されたか(xmaxが0)を返す
+    inserted = literal_column("(xmax = 0)").label("inserted")
+
+    dc = (
+        select(
+            DiscordAccount.discord_id, DiscordAccount.username, DiscordAccount.avatar
+        )
+        .where(DiscordAccount.discord_id == discord_id)
+        .cte("dc")
+    )
+
+    wd_stmt = pg_insert(WikidotAccount).values(
+        wikidot_id=acc.id, username=acc.username, unixname=acc.unixname
+    )
+    wd = (
+        wd_stmt.on_conflict_do_update(
+            index_elements=[WikidotAccount.wikidot_id],
+            set_={
+                "username": wd_stmt.excluded.username,
+                "unixname": wd_stmt.excluded.unixname,
+                "updated_at": func.now(),
+            },
+            where=or_(
+                WikidotAccount.username.is_distinct_from(wd_stmt.excluded.username),
+                WikidotAccount.unixname.is_distinct_from(wd_stmt.excluded.unixname),
+            ),
+        )
+        .returning(inserted)
+        .cte("wd")
+    )
+
+    link_stmt = pg_insert(LinkedAccount).from_select(
+        ["discord_id", "wikidot_id"], select(dc.c.discord_id, literal(acc.id))
+    )
+    link = (
+        link_stmt.on_conflict_do_update(
+            constraint="uq_linked_accounts_discord_id_wikidot_id",
+            set_={"unlinked_at": None, "updated_at": func.now()},
+            where=LinkedAccount.unlinked_at.is_not(None),
+        )
+        .returning(inserted)
+        .cte("link")
+    )
+
+    return select(
+        dc.c.username.label("discord_username"),
+        dc.c.avatar.label("discord_avatar"),
+        select(wd.c.inserted).scalar_subquery().label("wikidot_inserted"),
+        select(link.c.inserted).scalar_subquery().label("link_inserted"),
+    )
 
-    @staticmethod
-    def update_discord_account(
-        db: Session, acc: DiscordAccount, new_data: schemas.DiscordAccountSchema
-    ) -> DiscordAccount:
-        acc.username = new_data.username
-        acc.avatar = new_data.avatar
-        db.commit()
-        db.refresh(acc)
-        return acc
 
+async def _notify_link_result(discord_id: int, wikidot_id: int, row) -> None:
+    if row.wikidot_inserted is False:
+        await notify_change_async("wikidot_profile", wikidot_ids=[wikidot_id])
+    if row.link_inserted is not None:
+        await notify_change_async(
+            "link" if row.link_inserted else "relink",
+            discord_ids=[discord_id],
+            wikidot_ids=[wikidot_id],
+        )
+
+
+def _set_unlinked_query(pairs: list[tuple[int, int]], unlinked_at, condition):
+    """
+    複数の連携のunlinked_atを1文で更新する
+
+    conditionを満たす(状態が変わる)ものだけを更新し、更新したペアを返す
+    """
+    return (
+        update(LinkedAccount)
+        .where(
+            tuple_(LinkedAccount.discord_id, LinkedAccount.wikidot_id).in_(pairs),
+            condition,
+        )
+        .values(unlinked_at=unlinked_at)
+        .returning(LinkedAccount.discord_id, LinkedAccount.wikidot_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+class IOUtil:
     @staticmethod
     def get_wikidot_account(db: Session, wikidot_id: int) -> WikidotAccount | None:
         return (
@@ -83,139 +407,167 @@ class IOUtil:
         )
 
     @staticmethod
-    def create_wikidot_account(
-        db: Session, acc: schemas.WikidotAccountSchema
-    ) -> WikidotAccount:
-        wd_acc = WikidotAccount(
-            wikidot_id=acc.id, username=acc.username, unixname=acc.unixname
+    def delete_expired_link_request_tokens(
+        db: Session, expired_before: datetime, batch_size: int
+    ) -> int:
+        """期限切れのトークンを最大batch_size件削除する(ロックを短く保つため1バッチずつコミットする)"""
+        expired = (
+            select(LinkRequestToken.id)
+            .where(LinkRequestToken.created_at < expired_before)
+            .order_by(LinkRequestToken.created_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = db.execute(
+            delete(LinkRequestToken)
+            .where(LinkRequestToken.id.in_(expired.scalar_subquery()))
+            .execution_options(synchronize_session=False)
         )
-        db.add(wd_acc)
         db.commit()
-        db.refresh(wd_acc)
-        return wd_acc
 
-    @staticmethod
-    def update_wikidot_account(
-        db: Session, acc: WikidotAccount, new_data: schemas.WikidotAccountSchema
-    ) -> WikidotAccount:
-        if acc.wikidot_id != new_data.id:
-            raise ValueError(
-                f"Wikidot user id is not match in update_wikidot_account / {acc.wikidot_id} / {new_data.id}"
-            )
+        return result.rowcount
 
-        if acc.username != new_data.username or acc.unixname != new_data.unixname:
-            acc.username = new_data.username
-            acc.unixname = new_data.unixname
-            db.commit()
-            db.refresh(acc)
+    @staticmethod
+    def delete_old_link_changes(
+        db: Session, created_before: datetime, batch_size: int
+    ) -> int:
+        """保持期間を過ぎた変更履歴を古い順に最大batch_size件削除する(1バッチずつコミットする)"""
+        old = (
+            select(LinkChange.id)
+            .where(LinkChange.created_at < created_before)
+            .order_by(LinkChange.id)
+            .limit(batch_size)
+        )
+        result = db.execute(
+            delete(LinkChange)
+            .where(LinkChange.id.in_(old.scalar_subquery()))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
 
-        return acc
+        return result.rowcount
 
     @staticmethod
-    def create_link(
-        db: Session, dc_acc: DiscordAccount, wd_acc: WikidotAccount
-    ) -> LinkedAccount | None:
-        # 存在チェック
-        link = (
-            db.execute(
-                select(LinkedAccount).where(
-                    LinkedAccount.discord_id == dc_acc.discord_id,
-                    LinkedAccount.wikidot_id == wd_acc.wikidot_id,
-                )
-            )
-            .scalars()
-            .first()
-        )
-        if link is not None:
-            if link.unlinked_at is None:
-                return None
-            link.unlinked_at = None
-            db.commit()
-            db.refresh(link)
-            return link
+    def update_jp_member(
+        db: Session, site: MemberLookup, user: WikidotAccount
+    ) -> WikidotAccount:
+        is_jp_member = site.member_lookup(user.username, user.wikidot_id)
+        # 変化がなければ書き込まない
+        if user.is_jp_member == is_jp_member:
+            return user
 
-        link = LinkedAccount(discord=dc_acc, wikidot=wd_acc)
-        db.add(link)
+        user.is_jp_member = is_jp_member
         db.commit()
-        db.refresh(link)
-        return link
+        db.refresh(user)
+        notify_change("jp_member", wikidot_ids=[user.wikidot_id])
+
+        return user
 
     @staticmethod
-    def get_discord_account_from_token(
-        db: Session, token: str
-    ) -> DiscordAccount | None:
-        # 10分以内のトークンを取得
-        token = (
-            db.execute(
-                select(LinkRequestToken).where(
-                    LinkRequestToken.token == token,
-                    LinkRequestToken.created_at
-                    >= datetime.now() - timedelta(minutes=10),
-                )
+    def get_jp_member_flags(db: Session) -> dict[int, bool]:
+        """wikidot_id -> is_jp_member"""
+        return {
+            wikidot_id: is_jp_member
+            for wikidot_id, is_jp_member in db.execute(
+                select(WikidotAccount.wikidot_id, WikidotAccount.is_jp_member)
             )
-            .scalars()
-            .first()
-        )
-        if token is None:
-            return None
-
-        return token.discord
+        }
 
     @staticmethod
-    def start_flow(db: Session, acc: schemas.DiscordAccountSchema) -> LinkRequestToken:
-        print(acc)
-        discord_account = IOUtil.get_discord_account(db, int(acc.id))
-        if discord_account is None:
-            discord_account = IOUtil.create_discord_account(db, acc)
-
-        token = LinkRequestToken(
-            discord=discord_account,
-            token=secrets.token_urlsafe(32),
-            created_at=datetime.now(),
-        )
-        db.add(token)
+    def bulk_update_jp_member(db: Session, changes: dict[int, bool]) -> int:
+        """UPDATE ... FROM (VALUES ...) で変更分だけを1文で書き戻す"""
+        if len(changes) == 0:
+            return 0
+
+        v = values(
+            column("wikidot_id", Integer), column("is_jp_member", Boolean), name="v"
+        ).data(list(changes.items()))
+        result = db.execute(
+            update(WikidotAccount)
+            .where(WikidotAccount.wikidot_id == v.c.wikidot_id)
+            .values(is_jp_member=v.c.is_jp_member)
+            .execution_options(synchronize_session=False)
+        )
         db.commit()
+        notify_change("jp_member", wikidot_ids=changes.keys())
 
-        return token.token
+        return result.rowcount
 
     @staticmethod
-    def update_jp_member(
-        db: Session, client: wikidot.Client, user: WikidotAccount
-    ) -> WikidotAccount:
-        site = client.site.get("scp-jp")
-        user.is_jp_member = site.member_lookup(user.username, user.wikidot_id)
-        db.commit()
-        db.refresh(user)
+    def get_some_discord_accounts_json(
+        db: Session, discord_ids: list[int]
+    ) -> list[tuple[int, str, list[int]]]:
+        """(discord_id, AccountResponseFromDiscordSchema相当のJSON文字列, 連携先のwikidot_id)のリスト"""
+        base = select(
+            DiscordAccount.id,
+            DiscordAccount.discord_id,
+            DiscordAccount.username,
+            DiscordAccount.avatar,
+        ).where(DiscordAccount.discord_id.in_(discord_ids))
+        stmt = _discord_accounts_json_query(
+            base, include_unlinked=False, with_link_dates=False
+        )
+        return [(row[1], row[2], row[3]) for row in db.execute(stmt)]
 
-        return user
+    @staticmethod
+    def get_some_wikidot_accounts_json(
+        db: Session, wikidot_ids: list[int]
+    ) -> list[tuple[int, str]]:
+        """(wikidot_id, AccountResponseFromWikidotSchema相当のJSON文字列)のリスト"""
+        base = select(
+            WikidotAccount.id,
+            WikidotAccount.wikidot_id,
+            WikidotAccount.username,
+            WikidotAccount.unixname,
+            WikidotAccount.is_jp_member,
+        ).where(WikidotAccount.wikidot_id.in_(wikidot_ids))
+        stmt = _wikidot_accounts_json_query(
+            base, include_unlinked=False, with_link_dates=False
+        )
+        return [(row[1], row[2]) for row in db.execute(stmt)]
 
     @staticmethod
-    def get_discord_accounts(db: Session):
-        return (
-            db.execute(
-                select(DiscordAccount).options(
-                    joinedload(DiscordAccount.linked_accounts).joinedload(
-                        LinkedAccount.wikidot
-                    )
-                )
-            )
-            .scalars()
-            .unique()
+    def get_discord_accounts_json(
+        db: Session,
+        limit: int | None = None,
+        after: int | None = None,
+        is_jp_member: bool | None = None,
+        has_active_link: bool | None = None,
+    ) -> list[tuple[int, str]]:
+        """(id, ListDiscordItemSchema相当のJSON文字列)のリスト"""
+        base = select(
+            DiscordAccount.id,
+            DiscordAccount.discord_id,
+            DiscordAccount.username,
+            DiscordAccount.avatar,
+        ).where(*_discord_filters(is_jp_member, has_active_link))
+        stmt = _discord_accounts_json_query(
+            _paginate(base, DiscordAccount.id, limit, after),
+            include_unlinked=True,
+            with_link_dates=True,
         )
+        return [(row[0], row[2]) for row in db.execute(stmt)]
 
     @staticmethod
-    def get_wikidot_accounts(db: Session):
-        return (
-            db.execute(
-                select(WikidotAccount).options(
-                    joinedload(WikidotAccount.linked_accounts).joinedload(
-                        LinkedAccount.discord
-                    )
-                )
-            )
-            .scalars()
-            .unique()
+    def get_wikidot_accounts_json(
+        db: Session,
+        limit: int | None = None,
+        after: int | None = None,
+        is_jp_member: bool | None = None,
+        has_active_link: bool | None = None,
+    ) -> list[tuple[int, str]]:
+        """(id, ListWikidotItemSchema相当のJSON文字列)のリスト"""
+        base = select(
+            WikidotAccount.id,
+            WikidotAccount.wikidot_id,
+            WikidotAccount.username,
+            WikidotAccount.unixname,
+            WikidotAccount.is_jp_member,
+        ).where(*_wikidot_filters(is_jp_member, has_active_link))
+        stmt = _wikidot_accounts_json_query(
+            _paginate(base, WikidotAccount.id, limit, after)
         )
+        return [(row[0], row[2]) for row in db.execute(stmt)]
 
     @staticmethod
     def unlink(db: Session, discord_id: int, wikidot_id: int):
@@ -235,6 +587,7 @@ class IOUtil:
 
         target.unlinked_at = datetime.now()
         db.commit()
+        notify_change("unlink", discord_ids=[discord_id], wikidot_ids=[wikidot_id])
         return True
 
     @staticmethod
@@ -256,4 +609,245 @@ class IOUtil:
 
         target.unlinked_at = None
         db.commit()
+        notify_change("relink", discord_ids=[discord_id], wikidot_ids=[wikidot_id])
         return True
+
+    @staticmethod
+    def get_link_changes(db: Session, since: int, limit: int) -> list[LinkChange]:
+        """idがsinceより大きい変更履歴を古い順に返す"""
+        return list(db.execute(_link_changes_query(since, limit)).scalars())
+
+    @staticmethod
+    def iter_link_graph(db: Session, chunk_size: int = 1000):
+        """連携情報をサーバーサイドカーソルで少しずつ読み出す"""
+        stmt = (
+            select(
+                DiscordAccount.discord_id,
+                DiscordAccount.username.label("discord_username"),
+                DiscordAccount.avatar,
+                WikidotAccount.wikidot_id,
+                WikidotAccount.username.label("wikidot_username"),
+                WikidotAccount.unixname,
+                WikidotAccount.is_jp_member,
+                LinkedAccount.created_at,
+                LinkedAccount.updated_at,
+                LinkedAccount.unlinked_at,
+            )
+            .join(LinkedAccount, LinkedAccount.discord_id == DiscordAccount.discord_id)
+            .join(WikidotAccount, WikidotAccount.wikidot_id == LinkedAccount.wikidot_id)
+            .order_by(LinkedAccount.id)
+        )
+        result = db.execute(
+            stmt, execution_options={"stream_results": True, "yield_per": chunk_size}
+        )
+        yield from result.mappings()
+
+
+class AsyncIOUtil:
+    """
+    async defのルートから使うDB操作(イベントループをブロックしない)
+
+    ルートが使うものだけを持ち、クエリはIOUtilとモジュールレベルの関数で共有する
+    """
+
+    @staticmethod
+    async def get_discord_account(
+        db: AsyncSession, discord_id: int
+    ) -> DiscordAccount | None:
+        return (
+            (await db.execute(_discord_account_query(discord_id)))
+            .unique()
+            .scalars()
+            .first()
+        )
+
+    @staticmethod
+    async def update_discord_account(
+        db: AsyncSession, acc: DiscordAccount, new_data: schemas.DiscordAccountSchema
+    ) -> DiscordAccount:
+        # 変化がなければ書き込まない(データバージョン・キャッシュを無駄に更新しない)
+        if acc.username == new_data.username and acc.avatar == new_data.avatar:
+            return acc
+
+        acc.username = new_data.username
+        acc.avatar = new_data.avatar
+        await db.commit()
+        # relationshipはlazy loadできないため、カラムのみ再取得する
+        await db.refresh(acc, attribute_names=["username", "avatar", "updated_at"])
+        await notify_change_async("discord_profile", discord_ids=[acc.discord_id])
+        return acc
+
+    @staticmethod
+    async def update_jp_members(
+        db: AsyncSession,
+        site: MemberLookup,
+        users: list[WikidotAccount],
+        concurrency: int = JP_MEMBER_LOOKUP_CONCURRENCY,
+    ) -> list[WikidotAccount]:
+        """複数アカウントのJPメンバー判定を並行して行い、1トランザクションで書き戻す"""
+        if len(users) == 0:
+            return users
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def lookup(user: WikidotAccount) -> bool:
+            async with semaphore:
+                # wikidotへの照会は同期処理のため、スレッドで実行する
+                return await asyncio.to_thread(
+                    site.member_lookup, user.username, user.wikidot_id
+                )
+
+        results = await asyncio.gather(*[lookup(user) for user in users])
+
+        changed = [
+            (user, is_jp_member)
+            for user, is_jp_member in zip(users, results)
+            if user.is_jp_member != is_jp_member
+        ]
+        # 変化がなければ書き込まない
+        if len(changed) == 0:
+            return users
+
+        for user, is_jp_member in changed:
+            user.is_jp_member = is_jp_member
+        await db.commit()
+        await notify_change_async(
+            "jp_member", wikidot_ids=[user.wikidot_id for user, _ in changed]
+        )
+
+        return users
+
+    @staticmethod
+    async def link_accounts(
+        db: AsyncSession, discord_id: int, acc: schemas.WikidotAccountSchema
+    ):
+        """
+        Wikidotアカウントの作成・更新と連携を1トランザクション(1文)で行う
+
+        Discordアカウントが存在しなければ何も書き込まずにNoneを返す
+        """
+        row = (await db.execute(_link_accounts_query(discord_id, acc))).first()
+        if row is None:
+            await db.rollback()
+            return None
+
+        await db.commit()
+        await _notify_link_result(discord_id, acc.id, row)
+
+        return row
+
+    @staticmethod
+    async def upsert_discord_account(
+        db: AsyncSession, acc: schemas.DiscordAccountSchema
+    ) -> int:
+        """Discordアカウントを作成・更新し、discord_accounts.idを返す"""
+        row = (await db.execute(_upsert_discord_account_query(acc))).one_or_none()
+        if row is None:
+            # 他のトランザクションが同じ内容で作成した行は、新しい文で読み直す
+            discord_account_id = (
+                await db.execute(_discord_account_id_query(int(acc.id)))
+            ).scalar_one()
+            await db.commit()
+            return discord_account_id
+
+        await db.commit()
+        if row.changed:
+            await notify_change_async("discord_profile", discord_ids=[int(acc.id)])
+
+        return row.id
+
+    @staticmethod
+    async def add_link_request_token(
+        db: AsyncSession, discord_account_id: int, token: str
+    ):
+        """発行したトークンの記録(監査用。有効期限の判定には使わない)"""
+        db.add(
+            LinkRequestToken(
+                discord_account_id=discord_account_id,
+                token=token,
+                created_at=datetime.now(),
+            )
+        )
+        await db.commit()
+
+    @staticmethod
+    async def _bulk_set_unlinked(
+        db: AsyncSession,
+        kind: str,
+        pairs: list[tuple[int, int]],
+        unlinked_at,
+        condition,
+    ) -> list[tuple[int, int]]:
+        """ペアのunlinked_atをまとめて更新し、実際に更新したペアを返す"""
+        if len(pairs) == 0:
+            return []
+
+        result = await db.execute(_set_unlinked_query(pairs, unlinked_at, condition))
+        changed = [(row.discord_id, row.wikidot_id) for row in result]
+        await db.commit()
+
+        if len(changed) > 0:
+            await notify_change_async(
+                kind,
+                discord_ids=list({d for d, _ in changed}),
+                wikidot_ids=list({w for _, w in changed}),
+            )
+        return changed
+
+    @staticmethod
+    async def bulk_unlink(
+        db: AsyncSession, pairs: list[tuple[int, int]]
+    ) -> list[tuple[int, int]]:
+        """ペアをまとめてunlinkし、実際にunlinkしたペアを返す"""
+        return await AsyncIOUtil._bulk_set_unlinked(
+            db, "unlink", pairs, func.now(), LinkedAccount.unlinked_at.is_(None)
+        )
+
+    @staticmethod
+    async def bulk_relink(
+        db: AsyncSession, pairs: list[tuple[int, int]]
+    ) -> list[tuple[int, int]]:
+        """ペアをまとめてrelinkし、実際にrelinkしたペアを返す"""
+        return await AsyncIOUtil._bulk_set_unlinked(
+            db, "relink", pairs, None, LinkedAccount.unlinked_at.is_not(None)
+        )
+
+    @staticmethod
+    async def get_link_changes(
+        db: AsyncSession, since: int, limit: int
+    ) -> list[LinkChange]:
+        """idがsinceより大きい変更履歴を古い順に返す"""
+        return list((await db.execute(_link_changes_query(since, limit))).scalars())
+
+    @staticmethod
+    async def get_latest_link_change_id(db: AsyncSession) -> int:
+        """最新の変更履歴のidを返す(履歴がなければ0)"""
+        return (await db.execute(select(func.max(LinkChange.id)))).scalar() or 0
+
+    @staticmethod
+    async def get_link_graph_tables(db: AsyncSession) -> tuple[list, list, list]:
+        """インメモリの索引を作るため、アカウントと連携の全行を必要な列だけ返す"""
+        discord = await db.execute(
+            select(
+                DiscordAccount.discord_id,
+                DiscordAccount.username,
+                DiscordAccount.avatar,
+            )
+        )
+        wikidot = await db.execute(
+            select(
+                WikidotAccount.wikidot_id,
+                WikidotAccount.username,
+                WikidotAccount.unixname,
+                WikidotAccount.is_jp_member,
+            )
+        )
+        links = await db.execute(
+            select(
+                LinkedAccount.id,
+                LinkedAccount.discord_id,
+                LinkedAccount.wikidot_id,
+                LinkedAccount.unlinked_at,
+            ).order_by(LinkedAccount.id)
+        )
+        return list(discord), list(wikidot), list(links)
@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from db.package import schemas
+from db.package.models import DiscordAccount, LinkedAccount, WikidotAccount
+from db.package.util import AsyncIOUtil
+
+DISCORD_ID = 100000000000000001
+WIKIDOT = schemas.WikidotAccountSchema(id=123, username="User", unixname="user")
+
+
+def add_discord_account(engine):
+    with Session(engine) as db:
+        db.add(DiscordAccount(discord_id=DISCORD_ID, username="discord", avatar=None))
+        db.commit()
+
+
+def link(run_async, discord_id=DISCORD_ID, acc=WIKIDOT):
+    return run_async(lambda db: AsyncIOUtil.link_accounts(db, discord_id, acc))
+
+
+def get_links(engine) -> list[LinkedAccount]:
+    with Session(engine) as db:
+        return list(db.execute(select(LinkedAccount)).scalars())
+
+
+def test_new_link(engine, run_async):
+    add_discord_account(engine)
+
+    row = link(run_async)
+
+    assert row.discord_username == "discord"
+    assert row.wikidot_inserted is True
+    assert row.link_inserted is True
+    links = get_links(engine)
+    assert [(la.discord_id, la.wikidot_id) for la in links] == [(DISCORD_ID, 123)]
+    assert links[0].unlinked_at is None
+
+
+def test_existing_link(engine, run_async):
+    add_discord_account(engine)
+    link(run_async)
+
+    row = link(run_async)
+
+    # 変更がなければ何も書き込まない
+    assert row.wikidot_inserted is None
+    assert row.link_inserted is None
+    assert len(get_links(engine)) == 1
+
+
+def test_existing_link_with_profile_change(engine, run_async):
+    add_discord_account(engine)
+    link(run_async)
+
+    renamed = schemas.WikidotAccountSchema(id=123, username="Renamed", unixname="r")
+    row = link(run_async, acc=renamed)
+
+    assert row.wikidot_inserted is False
+    assert row.link_inserted is None
+    with Session(engine) as db:
+        wd = db.execute(select(WikidotAccount)).scalars().one()
+        assert (wd.username, wd.unixname) == ("Renamed", "r")
+
+
+def test_relink_unlinked_pair(engine, run_async):
+    add_discord_account(engine)
+    link(run_async)
+    with Session(engine) as db:
+        db.execute(update(LinkedAccount).values(unlinked_at=datetime.now(timezone.utc)))
+        db.commit()
+
+    row = link(run_async)
+
+    assert row.link_inserted is False
+    links = get_links(engine)
+    assert len(links) == 1
+    assert links[0].unlinked_at is None
+
+
+def test_missing_discord_account(engine, run_async):
+    row = link(run_async)
+
+    assert row is None
+    # Wikidotアカウントも作られない(ロールバックされる)
+    with Session(engine) as db:
+        assert db.execute(select(WikidotAccount)).first() is None
+    assert get_links(engine) == []
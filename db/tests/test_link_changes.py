@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from db.package.models import LinkChange
+from db.package.util import IOUtil
+
+NOW = datetime.now(timezone.utc)
+
+
+def add_changes(engine, ages_days: list[int]):
+    with Session(engine) as db:
+        for i, age in enumerate(ages_days):
+            db.add(
+                LinkChange(
+                    kind="link",
+                    discord_id=i,
+                    wikidot_id=i,
+                    created_at=NOW - timedelta(days=age),
+                )
+            )
+        db.commit()
+
+
+def remaining_ages(engine) -> list[int]:
+    with Session(engine) as db:
+        changes = db.execute(select(LinkChange).order_by(LinkChange.id)).scalars()
+        return [(NOW - c.created_at).days for c in changes]
+
+
+def test_delete_old_link_changes(engine):
+    add_changes(engine, [40, 35, 31, 10, 0])
+
+    with Session(engine) as db:
+        deleted = IOUtil.delete_old_link_changes(db, NOW - timedelta(days=30), 1000)
+
+    assert deleted == 3
+    assert remaining_ages(engine) == [10, 0]
+
+
+def test_delete_old_link_changes_in_batches(engine):
+    add_changes(engine, [40, 35, 31, 10])
+
+    with Session(engine) as db:
+        first = IOUtil.delete_old_link_changes(db, NOW - timedelta(days=30), 2)
+        second = IOUtil.delete_old_link_changes(db, NOW - timedelta(days=30), 2)
+
+    # 古い順に消える
+    assert (first, second) == (2, 1)
+    assert remaining_ages(engine) == [10]
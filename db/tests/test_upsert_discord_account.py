@@ -0,0 +1,82 @@
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from db.package import schemas
+from db.package.models import DiscordAccount
+from db.package.util import AsyncIOUtil
+
+DISCORD = schemas.DiscordAccountSchema(
+    id="100000000000000001", username="discord", avatar="avatar"
+)
+
+
+def get_accounts(engine) -> list[DiscordAccount]:
+    with Session(engine) as db:
+        return list(db.execute(select(DiscordAccount)).scalars())
+
+
+def test_new_account(engine, run_async):
+    account_id = run_async(lambda db: AsyncIOUtil.upsert_discord_account(db, DISCORD))
+
+    assert [a.id for a in get_accounts(engine)] == [account_id]
+
+
+def test_unchanged_account(engine, run_async):
+    first = run_async(lambda db: AsyncIOUtil.upsert_discord_account(db, DISCORD))
+    second = run_async(lambda db: AsyncIOUtil.upsert_discord_account(db, DISCORD))
+
+    assert first == second
+    assert len(get_accounts(engine)) == 1
+
+
+def test_concurrent_create(engine, run_async):
+    async def main(db: AsyncSession):
+        async with AsyncSession(db.bind) as other:
+            # 先に作成したトランザクションのコミット待ちになる
+            other.add(
+                DiscordAccount(
+                    discord_id=int(DISCORD.id),
+                    username=DISCORD.username,
+                    avatar=DISCORD.avatar,
+                )
+            )
+            await other.flush()
+
+            upsert = asyncio.create_task(
+                AsyncIOUtil.upsert_discord_account(db, DISCORD)
+            )
+            await asyncio.sleep(0.5)
+            assert not upsert.done()
+
+            await other.commit()
+            return await upsert
+
+    account_id = run_async(main)
+
+    assert [a.id for a in get_accounts(engine)] == [account_id]
+
+
+def test_update_unchanged_account_does_not_notify(engine, run_async, monkeypatch):
+    notified = []
+
+    async def notify(kind, discord_ids=(), wikidot_ids=()):
+        notified.append((kind, list(discord_ids)))
+
+    monkeypatch.setattr("db.package.util.notify_change_async", notify)
+
+    async def update(db: AsyncSession, new_data: schemas.DiscordAccountSchema):
+        await AsyncIOUtil.upsert_discord_account(db, DISCORD)
+        acc = await AsyncIOUtil.get_discord_account(db, int(DISCORD.id))
+        return await AsyncIOUtil.update_discord_account(db, acc, new_data)
+
+    # 作成時の1回のみ(同じ内容での更新は通知しない)
+    run_async(lambda db: update(db, DISCORD))
+    assert notified == [("discord_profile", [int(DISCORD.id)])]
+
+    changed = DISCORD.model_copy(update={"username": "renamed"})
+    acc = run_async(lambda db: update(db, changed))
+    assert acc.username == "renamed"
+    assert notified == [("discord_profile", [int(DISCORD.id)])] * 2
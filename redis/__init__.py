@@ -1,2 +1,16 @@
+from .cache import AccountCache as AccountCache
+from .cache import CACHE_DB as CACHE_DB
+from .events import LinkEventPublisher as LinkEventPublisher
+from .events import subscribe_link_events as subscribe_link_events
+from .queue import JobQueue as JobQueue
+from .queue import QUEUE_DB as QUEUE_DB
 from .redis import RedisCrud as RedisCrud
+from .redis import close_pools as close_pools
+from .redis import get_pool_stats as get_pool_stats
+from .redis import init_pool as init_pool
+from .session import LazySession as LazySession
 from .session import SessionCrud as SessionCrud
+from .singleflight import SingleFlight as SingleFlight
+from .snapshot import ListSnapshot as ListSnapshot
+from .token import LinkTokenStore as LinkTokenStore
+from .version import DataVersion as DataVersion
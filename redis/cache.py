@@ -0,0 +1,116 @@
+import os
+
+import redis
+
+from .redis import get_pool
+
+# セッション(db=0)とは別のDBを使う
+CACHE_DB = int(os.environ.get("REDIS_CACHE_DB", 1))
+
+# 書き込みごとに増えるデータバージョンのキー(DataVersionと共有する)
+DATA_VERSION_KEY = "data-version"
+
+# 読み込み前のデータバージョンから変わっていなければ保存する
+# (読み込み中に書き込みがあれば、古い値でキャッシュを埋めない)
+_SET_IF_VERSION_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], ARGV[i + 1], 'EX', ARGV[2])
+end
+return 1
+"""
+
+
+class AccountCache:
+    """/v1/list 向けのDiscordアカウント単位のレスポンスキャッシュ"""
+
+    key_prefix = "account:discord:"
+    reverse_key_prefix = "account:wikidot-refs:"
+    stats_key = "stats:account_cache"
+
+    def __init__(self):
+        self.connect = redis.Redis(connection_pool=get_pool(CACHE_DB))
+        self.expire = int(os.environ.get("ACCOUNT_CACHE_EXPIRE", 60 * 60))
+        self._set_if_version = self.connect.register_script(_SET_IF_VERSION_SCRIPT)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connect.close()
+
+    def _key(self, discord_id: int) -> str:
+        return f"{self.key_prefix}{discord_id}"
+
+    def _reverse_key(self, wikidot_id: int) -> str:
+        return f"{self.reverse_key_prefix}{wikidot_id}"
+
+    def get_many(self, discord_ids: list[int]) -> dict[int, bytes]:
+        """キャッシュ済みのものだけを返す"""
+        if len(discord_ids) == 0:
+            return {}
+
+        values = self.connect.mget([self._key(i) for i in discord_ids])
+        hits = {i: v for i, v in zip(discord_ids, values) if v is not None}
+
+        pipe = self.connect.pipeline(transaction=False)
+        pipe.hincrby(self.stats_key, "hits", len(hits))
+        pipe.hincrby(self.stats_key, "misses", len(discord_ids) - len(hits))
+        pipe.execute()
+
+        return hits
+
+    def set_many(self, values: dict[int, tuple[str, list[int]]], version: int) -> bool:
+        """
+        discord_id -> (シリアライズ済みの値, 連携先のwikidot_id) を保存する
+
+        version: DBを読む前に取得したデータバージョン
+        (その後に書き込みがあれば古い値の可能性があるため保存せず、Falseを返す)
+        """
+        if len(values) == 0:
+            return True
+
+        # wikidot側の変更から該当するキャッシュを引けるようにしておく
+        # (保存しなかった場合に余分に残っても、無効化が増えるだけ)
+        pipe = self.connect.pipeline(transaction=False)
+        for discord_id, (_, wikidot_ids) in values.items():
+            for wikidot_id in wikidot_ids:
+                pipe.sadd(self._reverse_key(wikidot_id), discord_id)
+                pipe.expire(self._reverse_key(wikidot_id), self.expire)
+        pipe.execute()
+
+        stored = self._set_if_version(
+            keys=[DATA_VERSION_KEY, *[self._key(i) for i in values]],
+            args=[version, self.expire, *[data for data, _ in values.values()]],
+        )
+        if not stored:
+            self.connect.hincrby(self.stats_key, "stale_fills", 1)
+        return stored == 1
+
+    def invalidate(self, discord_ids: list[int], wikidot_ids: list[int]) -> None:
+        keys = [self._key(i) for i in discord_ids]
+
+        if len(wikidot_ids) > 0:
+            pipe = self.connect.pipeline(transaction=False)
+            for wikidot_id in wikidot_ids:
+                pipe.smembers(self._reverse_key(wikidot_id))
+            for members in pipe.execute():
+                keys.extend(self._key(int(m)) for m in members)
+            keys.extend(self._reverse_key(i) for i in wikidot_ids)
+
+        if len(keys) > 0:
+            self.connect.delete(*keys)
+
+    def stats(self) -> dict:
+        data = self.connect.hgetall(self.stats_key)
+        hits = int(data.get(b"hits", 0))
+        misses = int(data.get(b"misses", 0))
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "stale_fills": int(data.get(b"stale_fills", 0)),
+            "hit_ratio": hits / total if total else 0.0,
+        }
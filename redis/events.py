@@ -0,0 +1,55 @@
+import json
+import os
+from contextlib import asynccontextmanager
+
+import redis
+import redis.asyncio
+
+from .redis import get_pool
+
+# 連携情報の変更を全ワーカーへ知らせるチャンネル(pub/subはDB番号に依存しない)
+LINK_EVENTS_CHANNEL = os.environ.get("LINK_EVENTS_CHANNEL", "link-events")
+
+
+class LinkEventPublisher:
+    """連携情報の変更をRedis pub/subで配信する"""
+
+    def __init__(self):
+        self.connect = redis.Redis(connection_pool=get_pool(0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connect.close()
+
+    def publish(self, kind: str, discord_ids: list[int], wikidot_ids: list[int]):
+        return self.connect.publish(
+            LINK_EVENTS_CHANNEL,
+            json.dumps(
+                {"kind": kind, "discord_ids": discord_ids, "wikidot_ids": wikidot_ids}
+            ),
+        )
+
+
+@asynccontextmanager
+async def subscribe_link_events():
+    """
+    変更通知を購読する(ストリーミング接続ごとに1本の接続を専有する)
+
+    pub/subの接続はブロッキングで待ち続けるため、共有プールとは別に張る
+    """
+    connect = redis.asyncio.Redis(
+        host=os.environ.get("REDIS_HOST", "redis"),
+        port=int(os.environ.get("REDIS_PORT", 6379)),
+        socket_connect_timeout=5,
+        health_check_interval=int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30)),
+        socket_keepalive=True,
+    )
+    pubsub = connect.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(LINK_EVENTS_CHANNEL)
+        yield pubsub
+    finally:
+        await pubsub.aclose()
+        await connect.aclose()
@@ -0,0 +1,197 @@
+import os
+import time
+
+import redis
+
+from .redis import get_pool
+
+# セッション(db=0)・キャッシュとは別のDBを使う
+QUEUE_DB = int(os.environ.get("REDIS_QUEUE_DB", 2))
+
+# 実行可能になったジョブを、処理中の件数が上限に達しない範囲で処理中へ移す
+_CLAIM_SCRIPT = """
+local free = tonumber(ARGV[3]) - redis.call('ZCARD', KEYS[2])
+if free <= 0 then
+    return {}
+end
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, free)
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('ZADD', KEYS[2], ARGV[2], id)
+end
+return ids
+"""
+
+# 期限内にack/failされなかった(ワーカーが落ちた)ジョブを待機列へ戻す
+_REAP_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('ZADD', KEYS[1], 'NX', ARGV[1], id)
+end
+return #ids
+"""
+
+
+class JobQueue:
+    """IDで重複排除するRedis上のジョブキュー
+
+    待機列・処理中ともにsorted setで持ち、scoreにそれぞれ実行可能時刻・リース期限を入れる
+    """
+
+    key_prefix = "queue:"
+    stats_key_prefix = "stats:queue:"
+
+    def __init__(self, name: str):
+        self.connect = redis.Redis(connection_pool=get_pool(QUEUE_DB))
+        self.name = name
+
+        env_prefix = f"{name.upper()}_QUEUE_"
+        # 全ワーカー合計での同時実行数
+        self.concurrency = int(os.environ.get(env_prefix + "CONCURRENCY", 4))
+        # 全ワーカー合計での1秒あたりの実行数
+        self.rate_limit = int(os.environ.get(env_prefix + "RATE_LIMIT", 5))
+        self.max_attempts = int(os.environ.get(env_prefix + "MAX_ATTEMPTS", 5))
+        self.retry_base = float(os.environ.get(env_prefix + "RETRY_BASE", 30))
+        self.lease = float(os.environ.get(env_prefix + "LEASE", 120))
+
+        self.pending_key = f"{self.key_prefix}{name}:pending"
+        self.processing_key = f"{self.key_prefix}{name}:processing"
+        self.dead_key = f"{self.key_prefix}{name}:dead"
+        self.enqueued_at_key = f"{self.key_prefix}{name}:enqueued_at"
+        self.attempts_key = f"{self.key_prefix}{name}:attempts"
+        self.rate_key_prefix = f"{self.key_prefix}{name}:rate:"
+        self.stats_key = f"{self.stats_key_prefix}{name}"
+
+        self._claim = self.connect.register_script(_CLAIM_SCRIPT)
+        self._reap = self.connect.register_script(_REAP_SCRIPT)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connect.close()
+
+    def enqueue(self, job_id: int | str) -> bool:
+        """待機中に同じIDがあれば追加しない(追加したかを返す)"""
+        now = time.time()
+
+        pipe = self.connect.pipeline()
+        pipe.zadd(self.pending_key, {job_id: now}, nx=True)
+        pipe.hsetnx(self.enqueued_at_key, job_id, now)
+        added = pipe.execute()[0] == 1
+
+        self.connect.hincrby(self.stats_key, "enqueued" if added else "deduped", 1)
+        return added
+
+    def claim(self) -> list[str]:
+        """実行可能なジョブを空いている同時実行枠の分だけ取得する"""
+        now = time.time()
+        self._reap(keys=[self.pending_key, self.processing_key], args=[now])
+
+        ids = [
+            i.decode()
+            for i in self._claim(
+                keys=[self.pending_key, self.processing_key],
+                args=[now, now + self.lease, self.concurrency],
+            )
+        ]
+        if len(ids) == 0:
+            return ids
+
+        # 待ち時間の記録(リトライ分は対象外)
+        pipe = self.connect.pipeline()
+        pipe.hmget(self.enqueued_at_key, ids)
+        pipe.hdel(self.enqueued_at_key, *ids)
+        enqueued_at = [float(v) for v in pipe.execute()[0] if v is not None]
+
+        if len(enqueued_at) > 0:
+            pipe = self.connect.pipeline(transaction=False)
+            pipe.hincrby(self.stats_key, "wait_count", len(enqueued_at))
+            pipe.hincrbyfloat(
+                self.stats_key, "wait_seconds", sum(now - t for t in enqueued_at)
+            )
+            pipe.execute()
+
+        return ids
+
+    def acquire_rate(self) -> None:
+        """1秒あたりの実行数の上限に達していれば、次の1秒まで待つ"""
+        while True:
+            now = time.time()
+            key = f"{self.rate_key_prefix}{int(now)}"
+
+            pipe = self.connect.pipeline()
+            pipe.incr(key)
+            pipe.expire(key, 2)
+            if pipe.execute()[0] <= self.rate_limit:
+                return
+
+            time.sleep(int(now) + 1 - now)
+
+    def ack(self, job_id: str, elapsed: float) -> None:
+        pipe = self.connect.pipeline()
+        pipe.zrem(self.processing_key, job_id)
+        pipe.hdel(self.attempts_key, job_id)
+        pipe.hincrby(self.stats_key, "succeeded", 1)
+        pipe.hincrbyfloat(self.stats_key, "run_seconds", elapsed)
+        pipe.execute()
+
+    def fail(self, job_id: str) -> bool:
+        """指数バックオフで再投入する(上限回数を超えたらdeadへ移し、Falseを返す)"""
+        attempts = self.connect.hincrby(self.attempts_key, job_id, 1)
+
+        pipe = self.connect.pipeline()
+        pipe.zrem(self.processing_key, job_id)
+        pipe.hincrby(self.stats_key, "failed", 1)
+        if attempts >= self.max_attempts:
+            pipe.hdel(self.attempts_key, job_id)
+            pipe.zadd(self.dead_key, {job_id: time.time()})
+            pipe.hincrby(self.stats_key, "dead", 1)
+        else:
+            delay = self.retry_base * 2 ** (attempts - 1)
+            pipe.zadd(self.pending_key, {job_id: time.time() + delay}, nx=True)
+            pipe.hincrby(self.stats_key, "retried", 1)
+        pipe.execute()
+
+        return attempts < self.max_attempts
+
+    def stats(self) -> dict:
+        now = time.time()
+
+        pipe = self.connect.pipeline(transaction=False)
+        pipe.zcard(self.pending_key)
+        pipe.zcount(self.pending_key, "-inf", now)
+        pipe.zcard(self.processing_key)
+        pipe.zcard(self.dead_key)
+        pipe.zrange(self.pending_key, 0, 0, withscores=True)
+        pipe.hgetall(self.stats_key)
+        pending, ready, processing, dead, oldest, data = pipe.execute()
+
+        counters = {
+            k: int(data.get(k.encode(), 0))
+            for k in ("enqueued", "deduped", "succeeded", "failed", "retried", "dead")
+        }
+        wait_count = int(data.get(b"wait_count", 0))
+        wait_seconds = float(data.get(b"wait_seconds", 0))
+        run_seconds = float(data.get(b"run_seconds", 0))
+
+        return {
+            "depth": {
+                "pending": pending,
+                "ready": ready,
+                "processing": processing,
+                "dead": dead,
+            },
+            "oldest_ready_age": max(now - oldest[0][1], 0.0) if oldest else 0.0,
+            "counters": counters,
+            "avg_wait_seconds": wait_seconds / wait_count if wait_count else 0.0,
+            "avg_run_seconds": (
+                run_seconds / counters["succeeded"] if counters["succeeded"] else 0.0
+            ),
+            "limits": {
+                "concurrency": self.concurrency,
+                "rate_limit": self.rate_limit,
+                "max_attempts": self.max_attempts,
+            },
+        }
@@ -1,4 +1,6 @@
 import json
+import os
+import threading
 
 import redis
 from .schemas import CustomSchemaBase, SessionSchema, SessionAuthSchema
@@ -24,14 +26,115 @@ class SessionEncoder(json.JSONEncoder):
         return d
 
 
+def _get_float_env(key: str, default: float | None) -> float | None:
+    value = os.environ.get(key)
+    if value is None or value == "":
+        return default
+    return float(value)
+
+
+class CountingBlockingConnectionPool(redis.BlockingConnectionPool):
+    """作成した接続数・貸し出し中の接続数を数えるコネクションプール"""
+
+    def __init__(self, *args, **kwargs):
+        # 親の__init__からreset()が呼ばれるため、先に用意しておく
+        self._counter_lock = threading.Lock()
+        self._created = 0
+        self._in_use = set()
+        super().__init__(*args, **kwargs)
+
+    def reset(self):
+        with self._counter_lock:
+            self._created = 0
+            self._in_use = set()
+        super().reset()
+
+    def make_connection(self):
+        connection = super().make_connection()
+        with self._counter_lock:
+            self._created += 1
+        return connection
+
+    def get_connection(self, *args, **kwargs):
+        connection = super().get_connection(*args, **kwargs)
+        with self._counter_lock:
+            self._in_use.add(id(connection))
+        return connection
+
+    def release(self, connection):
+        # 貸し出しに失敗した接続や、fork後のreset()より前に借りた接続は数えない
+        with self._counter_lock:
+            self._in_use.discard(id(connection))
+        super().release(connection)
+
+    def stats(self) -> dict:
+        with self._counter_lock:
+            return {
+                "max_connections": self.max_connections,
+                "created": self._created,
+                "idle": self._created - len(self._in_use),
+                "in_use": len(self._in_use),
+            }
+
+
+# プロセス全体で共有するコネクションプール(DB番号ごと)
+_pools: dict[int, CountingBlockingConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def init_pool(db: int) -> CountingBlockingConnectionPool:
+    """指定DB用のコネクションプールを作成する(作成済みならそれを返す)"""
+    with _pools_lock:
+        pool = _pools.get(db)
+        if pool is None:
+            pool = CountingBlockingConnectionPool(
+                host=os.environ.get("REDIS_HOST", "redis"),
+                port=int(os.environ.get("REDIS_PORT", 6379)),
+                db=db,
+                max_connections=int(os.environ.get("REDIS_POOL_MAX_CONNECTIONS", 32)),
+                timeout=_get_float_env("REDIS_POOL_TIMEOUT", 5),
+                socket_timeout=_get_float_env("REDIS_SOCKET_TIMEOUT", 5),
+                socket_connect_timeout=_get_float_env(
+                    "REDIS_SOCKET_CONNECT_TIMEOUT", 5
+                ),
+                health_check_interval=int(
+                    os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30)
+                ),
+                socket_keepalive=True,
+            )
+            _pools[db] = pool
+        return pool
+
+
+def get_pool(db: int) -> CountingBlockingConnectionPool:
+    pool = _pools.get(db)
+    if pool is None:
+        pool = init_pool(db)
+    return pool
+
+
+def close_pools() -> None:
+    """全プールの接続を切断する(アプリ終了時に呼ぶ)"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.disconnect()
+        _pools.clear()
+
+
+def get_pool_stats() -> dict[int, dict]:
+    """プールの使用状況を返す"""
+    return {db: pool.stats() for db, pool in list(_pools.items())}
+
+
 class RedisCrud:
     def __init__(self, db: int):
-        self.connect = redis.Redis(host="redis", port=6379, db=db)
+        self.connect = redis.Redis(connection_pool=get_pool(db))
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        # 共有プールへ接続を返却する(プール自体は閉じない)
         self.connect.close()
 
     def get(self, key: str):
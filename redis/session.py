@@ -1,3 +1,4 @@
+import asyncio
 import os
 import secrets
 
@@ -57,3 +58,50 @@ class SessionCrud:
             return None
         self._delete(sess_id)
         response.delete_cookie(key=self.cookie_name)
+
+
+class LazySession:
+    """最初のアクセス時にRedisから読み込み、変更された場合のみ保存するセッション"""
+
+    __slots__ = ("_session_crud", "_request", "_data", "_modified")
+
+    def __init__(self, session_crud: SessionCrud, request):
+        object.__setattr__(self, "_session_crud", session_crud)
+        object.__setattr__(self, "_request", request)
+        object.__setattr__(self, "_data", None)
+        object.__setattr__(self, "_modified", False)
+
+    def _load(self) -> SessionSchema:
+        if self._data is None:
+            data = self._session_crud.get(self._request)
+            if data is None:
+                data = SessionSchema()
+            object.__setattr__(self, "_data", data)
+        return self._data
+
+    async def load_async(self) -> None:
+        """async defのルートから、先にスレッドで読み込んでおく(以降の参照はRedisを引かない)"""
+        await asyncio.to_thread(self._load)
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+        object.__setattr__(self, "_modified", True)
+
+    @property
+    def modified(self) -> bool:
+        return self._modified
+
+    def save(self, response) -> None:
+        # 変更がなければRedisへは書き込まない
+        if not self._modified:
+            return
+        self._session_crud.update(self._request, response, self._data)
+
+    async def save_async(self, response) -> None:
+        # 変更がなければスレッドへも渡さない
+        if not self._modified:
+            return
+        await asyncio.to_thread(self.save, response)
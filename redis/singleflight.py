@@ -0,0 +1,139 @@
+import json
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+import redis
+
+from .cache import CACHE_DB
+from .redis import get_pool
+
+# 自分が取得したロックだけを解放する
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """キー単位で同時に走る処理を1つにまとめ、結果を短時間キャッシュする
+
+    プロセス内はFutureで、プロセス間はRedisのロックと結果キャッシュで待ち合わせる
+    結果はJSONにできる値に限る。例外はキャッシュせず、同時に待っていた呼び出しにのみ共有する
+    """
+
+    key_prefix = "singleflight:"
+    stats_key_prefix = "stats:singleflight:"
+
+    def __init__(
+        self,
+        name: str,
+        result_ttl: float,
+        lock_ttl: float,
+        wait_timeout: float,
+        poll_interval: float = 0.05,
+    ):
+        self.connect = redis.Redis(connection_pool=get_pool(CACHE_DB))
+        self.name = name
+        self.result_ttl = result_ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+        self.stats_key = f"{self.stats_key_prefix}{name}"
+        self._release = self.connect.register_script(_RELEASE_SCRIPT)
+
+        self._inflight: dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    def _result_key(self, key: str) -> str:
+        return f"{self.key_prefix}{self.name}:result:{key}"
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.key_prefix}{self.name}:lock:{key}"
+
+    def _get_cached(self, key: str) -> tuple[bool, Any]:
+        data = self.connect.get(self._result_key(key))
+        if data is None:
+            return False, None
+        return True, json.loads(data)
+
+    def _count(self, field: str) -> None:
+        self.connect.hincrby(self.stats_key, field, 1)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        found, value = self._get_cached(key)
+        if found:
+            self._count("cached")
+            return value
+
+        # 同じプロセス内で実行中のものがあれば、その結果を待つ
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            self._count("shared")
+            return future.result(timeout=self.wait_timeout)
+
+        try:
+            value = self._do_locked(key, fn)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _do_locked(self, key: str, fn: Callable[[], Any]) -> Any:
+        lock_key = self._lock_key(key)
+        token = secrets.token_hex(8)
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            if self.connect.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                try:
+                    # ロック待ちの間に他のプロセスが結果を書いている場合がある
+                    found, value = self._get_cached(key)
+                    if found:
+                        self._count("waited")
+                        return value
+
+                    value = fn()
+                    self._count("executed")
+                    self.connect.set(
+                        self._result_key(key),
+                        json.dumps(value),
+                        px=int(self.result_ttl * 1000),
+                    )
+                    return value
+                finally:
+                    self._release(keys=[lock_key], args=[token])
+
+            # 他のプロセスが実行中のため、結果が書かれるかロックが外れるまで待つ
+            time.sleep(self.poll_interval)
+            found, value = self._get_cached(key)
+            if found:
+                self._count("waited")
+                return value
+
+            if time.monotonic() > deadline:
+                # 待ちきれない場合は自分で実行する
+                self._count("executed")
+                return fn()
+
+    def stats(self) -> dict:
+        data = self.connect.hgetall(self.stats_key)
+        return {
+            k: int(data.get(k.encode(), 0))
+            for k in ("executed", "cached", "shared", "waited")
+        }
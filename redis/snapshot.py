@@ -0,0 +1,40 @@
+import redis
+
+from .cache import CACHE_DB
+from .redis import get_pool
+
+
+class ListSnapshot:
+    """全件のlistレスポンスを、エンコード済みのバイト列として保持する"""
+
+    key_prefix = "snapshot:list:"
+
+    def __init__(self):
+        self.connect = redis.Redis(connection_pool=get_pool(CACHE_DB))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connect.close()
+
+    def _key(self, name: str) -> str:
+        return f"{self.key_prefix}{name}"
+
+    def save(self, name: str, version: int, bodies: dict[str, bytes]) -> None:
+        """エンコーディングごとの本文を、生成元のデータバージョンとまとめて置き換える"""
+        pipe = self.connect.pipeline()
+        pipe.delete(self._key(name))
+        pipe.hset(self._key(name), mapping={"version": version, **bodies})
+        pipe.execute()
+
+    def version(self, name: str) -> int | None:
+        value = self.connect.hget(self._key(name), "version")
+        return int(value) if value is not None else None
+
+    def get(self, name: str, encoding: str) -> tuple[int, bytes] | None:
+        """(生成元のデータバージョン, 本文)を返す"""
+        version, body = self.connect.hmget(self._key(name), ["version", encoding])
+        if version is None or body is None:
+            return None
+        return int(version), body
@@ -0,0 +1,70 @@
+import os
+import secrets
+
+import redis
+
+from .redis import get_pool
+
+
+class LinkTokenStore:
+    """連携開始トークン(/v1/start で発行し、/v1/auth で1回だけ使える)"""
+
+    key_prefix = "link-token:"
+    discord_key_prefix = "link-token-discord:"
+
+    def __init__(self):
+        # セッションと同じDBに置く
+        self.connect = redis.Redis(connection_pool=get_pool(0))
+        self.expire = int(os.environ.get("LINK_TOKEN_EXPIRE", 60 * 10))
+        # 残り時間がこれ未満のトークンは再利用しない
+        self.reuse_min_ttl = int(
+            os.environ.get("LINK_TOKEN_REUSE_MIN_TTL", self.expire // 2)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connect.close()
+
+    def _key(self, token: str) -> str:
+        return f"{self.key_prefix}{token}"
+
+    def _discord_key(self, discord_id: int) -> str:
+        return f"{self.discord_key_prefix}{discord_id}"
+
+    def issue(self, discord_id: int) -> tuple[str, bool]:
+        """
+        トークンを発行する
+
+        同じDiscordアカウントに未使用で残り時間が十分なトークンがあれば、それを返す
+        戻り値は(トークン, 再利用したか)
+        """
+        discord_key = self._discord_key(discord_id)
+        token = secrets.token_urlsafe(32)
+        with self.connect.pipeline() as pipe:
+            while True:
+                try:
+                    # 確認してから保存するまでの間に、同じアカウントで発行されたら
+                    # やり直す(トークンのキーはマッピングの値から決まるためWATCHで扱う)
+                    pipe.watch(discord_key)
+                    current = pipe.get(discord_key)
+                    if current is not None:
+                        current = current.decode()
+                        if pipe.ttl(self._key(current)) >= self.reuse_min_ttl:
+                            return current, True
+
+                    pipe.multi()
+                    pipe.set(discord_key, token, ex=self.expire)
+                    pipe.set(self._key(token), discord_id, ex=self.expire)
+                    pipe.execute()
+                    return token, False
+                except redis.WatchError:
+                    continue
+
+    def redeem(self, token: str) -> int | None:
+        """トークンに紐づくdiscord_idを返し、トークンを消す(期限切れ・使用済みならNone)"""
+        discord_id = self.connect.getdel(self._key(token))
+        if discord_id is None:
+            return None
+        return int(discord_id)
@@ -0,0 +1,39 @@
+import time
+
+import redis
+
+from .cache import CACHE_DB, DATA_VERSION_KEY
+from .redis import get_pool
+
+
+class DataVersion:
+    """アカウント・連携情報の書き込みごとに増えるバージョン(list系のETagに使う)"""
+
+    key = DATA_VERSION_KEY
+
+    def __init__(self):
+        self.connect = redis.Redis(connection_pool=get_pool(CACHE_DB))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connect.close()
+
+    def _initial(self) -> int:
+        # キーが消えた後に、以前配ったバージョンと重ならないよう時刻から始める
+        return int(time.time() * 1000)
+
+    def get(self) -> int:
+        value = self.connect.get(self.key)
+        if value is not None:
+            return int(value)
+
+        self.connect.set(self.key, self._initial(), nx=True)
+        return int(self.connect.get(self.key))
+
+    def bump(self) -> int:
+        pipe = self.connect.pipeline()
+        pipe.set(self.key, self._initial(), nx=True)
+        pipe.incr(self.key)
+        return pipe.execute()[1]
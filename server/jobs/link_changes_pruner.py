@@ -0,0 +1,85 @@
+import logging
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import sentry_sdk
+
+from db.package.session import get_db
+from db.package.util import IOUtil
+from util.env import get_env
+
+# 実行間隔(秒)
+PRUNE_INTERVAL = int(get_env("LINK_CHANGES_PRUNE_INTERVAL", 60 * 60))
+# 1回のDELETEで消す最大件数
+PRUNE_BATCH_SIZE = int(get_env("LINK_CHANGES_PRUNE_BATCH_SIZE", 1000))
+# バッチ間の待機時間(秒)
+PRUNE_BATCH_SLEEP = float(get_env("LINK_CHANGES_PRUNE_BATCH_SLEEP", 0.5))
+# 保持期間(秒)。これより古いカーソルで/v1/list/changesを読むと、間の変更を取りこぼす
+LINK_CHANGES_RETENTION = int(get_env("LINK_CHANGES_RETENTION", 60 * 60 * 24 * 30))
+
+# ロガー
+LOGGER = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Sentry
+SENTRY_DSN = get_env("SENTRY_DSN", None)
+if SENTRY_DSN is not None:
+    sentry_sdk.init(dsn=SENTRY_DSN, traces_sample_rate=1.0)
+
+
+def prune() -> dict:
+    """保持期間を過ぎたlink_changesをバッチに分けて削除する"""
+    start = time.perf_counter()
+    created_before = datetime.now(timezone.utc) - timedelta(
+        seconds=LINK_CHANGES_RETENTION
+    )
+
+    deleted = 0
+    batches = 0
+    with get_db() as db:
+        while True:
+            count = IOUtil.delete_old_link_changes(db, created_before, PRUNE_BATCH_SIZE)
+            deleted += count
+            batches += 1
+
+            if count < PRUNE_BATCH_SIZE:
+                break
+
+            # 他の書き込みを妨げないよう間隔を空ける
+            time.sleep(PRUNE_BATCH_SLEEP)
+
+    report = {
+        "deleted": deleted,
+        "batches": batches,
+        "elapsed": round(time.perf_counter() - start, 3),
+    }
+    LOGGER.info(f"Link changes pruner completed: {report}")
+    return report
+
+
+def run_prune():
+    try:
+        prune()
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        LOGGER.error(f"Link changes pruner failed: {str(e)}")
+
+
+def main():
+    # 第1引数取得
+    arg1 = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if arg1 == "oneshot":
+        LOGGER.info("Running oneshot link changes pruner")
+        prune()
+        return
+
+    LOGGER.info(f"Scheduled link changes pruner every {PRUNE_INTERVAL} seconds")
+    while True:
+        run_prune()
+        time.sleep(PRUNE_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
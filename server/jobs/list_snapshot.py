@@ -0,0 +1,94 @@
+import logging
+import sys
+import time
+
+import sentry_sdk
+
+from db.package.session import get_db
+from redis_crud import DataVersion, ListSnapshot
+from util.env import get_env
+from util.list_snapshot import SNAPSHOT_LISTS, encode_snapshot, list_page_body
+
+# スナップショットが古くなっていないかを確認する間隔(秒)
+POLL_INTERVAL = float(get_env("LIST_SNAPSHOT_POLL_INTERVAL", 1))
+# 書き込みがこの秒数途切れるまで再生成を待つ
+DEBOUNCE = float(get_env("LIST_SNAPSHOT_DEBOUNCE", 5))
+# 書き込みが続いても、この秒数待ったら再生成する
+MAX_DELAY = float(get_env("LIST_SNAPSHOT_MAX_DELAY", 60))
+
+# ロガー
+LOGGER = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Sentry
+SENTRY_DSN = get_env("SENTRY_DSN", None)
+if SENTRY_DSN is not None:
+    sentry_sdk.init(dsn=SENTRY_DSN, traces_sample_rate=1.0)
+
+
+def is_stale(version: DataVersion, snapshot: ListSnapshot) -> bool:
+    current = version.get()
+    return any(snapshot.version(name) != current for name in SNAPSHOT_LISTS)
+
+
+def wait_for_quiet(version: DataVersion) -> None:
+    """書き込みがDEBOUNCE秒途切れるまで(最大MAX_DELAY秒)待つ"""
+    start = time.monotonic()
+    last = version.get()
+    while time.monotonic() - start < MAX_DELAY:
+        time.sleep(DEBOUNCE)
+        current = version.get()
+        if current == last:
+            return
+        last = current
+
+
+def refresh() -> dict:
+    """全件のlistレスポンスを作り直し、エンコード済みの本文を保存する"""
+    report = {}
+    with DataVersion() as version, ListSnapshot() as snapshot, get_db() as db:
+        # 生成中の書き込みは次の周回で反映されるよう、読む前のバージョンを記録する
+        data_version = version.get()
+        for name, fetch in SNAPSHOT_LISTS.items():
+            start = time.perf_counter()
+            body = list_page_body([data for _, data in fetch(db)], None)
+            bodies = encode_snapshot(body)
+            snapshot.save(name, data_version, bodies)
+            report[name] = {
+                "sizes": {k: len(v) for k, v in bodies.items()},
+                "elapsed": round(time.perf_counter() - start, 3),
+            }
+
+    LOGGER.info(f"List snapshot refreshed (version {data_version}): {report}")
+    return report
+
+
+def run_refresh():
+    try:
+        with DataVersion() as version, ListSnapshot() as snapshot:
+            if not is_stale(version, snapshot):
+                return
+            wait_for_quiet(version)
+        refresh()
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        LOGGER.error(f"List snapshot refresh failed: {str(e)}")
+
+
+def main():
+    # 第1引数取得
+    arg1 = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if arg1 == "oneshot":
+        LOGGER.info("Running oneshot list snapshot refresh")
+        refresh()
+        return
+
+    LOGGER.info(f"List snapshot started (debounce {DEBOUNCE}s, max delay {MAX_DELAY}s)")
+    while True:
+        run_refresh()
+        time.sleep(POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import logging
+import sys
+import time
+
+import sentry_sdk
+
+from db.package.session import get_db
+from db.package.util import IOUtil
+from util.env import get_env
+from util.listeners import register_listeners
+from util.wikidot_client import wikidot_manager
+
+# 実行間隔(秒)
+SWEEP_INTERVAL = int(get_env("MEMBERSHIP_SWEEP_INTERVAL", 60 * 60 * 6))
+
+# ロガー
+LOGGER = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Sentry
+SENTRY_DSN = get_env("SENTRY_DSN", None)
+if SENTRY_DSN is not None:
+    sentry_sdk.init(dsn=SENTRY_DSN, traces_sample_rate=1.0)
+
+
+def sweep() -> dict:
+    """scp-jpのメンバー一覧とwikidot_accountsを突き合わせ、変わった行だけを更新する"""
+    timings = {}
+
+    # メンバー一覧の取得
+    start = time.perf_counter()
+    member_ids = wikidot_manager.get_member_ids()
+    timings["fetch"] = time.perf_counter() - start
+
+    # 取得に失敗して空になった場合に全員を非メンバーにしないよう中断する
+    if len(member_ids) == 0:
+        raise RuntimeError("member list of the site is empty")
+
+    with get_db() as db:
+        # 差分の計算
+        start = time.perf_counter()
+        flags = IOUtil.get_jp_member_flags(db)
+        changes = {
+            wikidot_id: wikidot_id in member_ids
+            for wikidot_id, is_jp_member in flags.items()
+            if is_jp_member != (wikidot_id in member_ids)
+        }
+        timings["diff"] = time.perf_counter() - start
+
+        # 書き戻し
+        start = time.perf_counter()
+        updated = IOUtil.bulk_update_jp_member(db, changes)
+        timings["update"] = time.perf_counter() - start
+
+    report = {
+        "members": len(member_ids),
+        "accounts": len(flags),
+        "flipped": updated,
+        "joined": len([v for v in changes.values() if v]),
+        "left": len([v for v in changes.values() if not v]),
+        "timings": {k: round(v, 3) for k, v in timings.items()},
+    }
+    LOGGER.info(f"Membership sweep completed: {report}")
+    return report
+
+
+def run_sweep():
+    try:
+        sweep()
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        LOGGER.error(f"Membership sweep failed: {str(e)}")
+
+
+def main():
+    register_listeners()
+
+    # 第1引数取得
+    arg1 = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if arg1 == "oneshot":
+        LOGGER.info("Running oneshot membership sweep")
+        sweep()
+        return
+
+    LOGGER.info(f"Scheduled membership sweep every {SWEEP_INTERVAL} seconds")
+    while True:
+        run_sweep()
+        time.sleep(SWEEP_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sentry_sdk
+
+from db.package.session import get_db
+from db.package.util import IOUtil
+from redis_crud import JobQueue
+from util.env import get_env
+from util.jp_member_queue import JP_MEMBER_QUEUE
+from util.listeners import register_listeners
+from util.wikidot_client import wikidot_manager
+
+# キューが空のときのポーリング間隔(秒)
+POLL_INTERVAL = float(get_env("JP_MEMBER_QUEUE_POLL_INTERVAL", 1))
+
+# ロガー
+LOGGER = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Sentry
+SENTRY_DSN = get_env("SENTRY_DSN", None)
+if SENTRY_DSN is not None:
+    sentry_sdk.init(dsn=SENTRY_DSN, traces_sample_rate=1.0)
+
+
+def check_jp_member(wikidot_id: int):
+    with get_db() as db:
+        user = IOUtil.get_wikidot_account(db, wikidot_id)
+        # 処理までの間に削除されたアカウントは何もしない
+        if user is None:
+            return
+
+        IOUtil.update_jp_member(db, wikidot_manager, user)
+
+
+def run_job(queue: JobQueue, job_id: str):
+    queue.acquire_rate()
+
+    start = time.perf_counter()
+    try:
+        check_jp_member(int(job_id))
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        if queue.fail(job_id):
+            LOGGER.warning(f"JP member check failed, will retry: {job_id}: {str(e)}")
+        else:
+            LOGGER.error(f"JP member check gave up: {job_id}: {str(e)}")
+        return
+
+    queue.ack(job_id, time.perf_counter() - start)
+
+
+def main():
+    register_listeners()
+
+    with JobQueue(JP_MEMBER_QUEUE) as queue:
+        LOGGER.info(
+            f"JP member worker started "
+            f"(concurrency={queue.concurrency}, rate_limit={queue.rate_limit}/s)"
+        )
+
+        with ThreadPoolExecutor(max_workers=queue.concurrency) as executor:
+            while True:
+                # 同時実行数はRedis上の処理中件数で全ワーカー合計として制限される
+                job_ids = queue.claim()
+                if len(job_ids) == 0:
+                    time.sleep(POLL_INTERVAL)
+                    continue
+
+                for job_id in job_ids:
+                    executor.submit(run_job, queue, job_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import logging
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import sentry_sdk
+
+from db.package.session import get_db
+from db.package.util import IOUtil
+from util.env import get_env
+
+# 実行間隔(秒)
+REAP_INTERVAL = int(get_env("TOKEN_REAPER_INTERVAL", 60 * 60))
+# 1回のDELETEで消す最大件数
+REAP_BATCH_SIZE = int(get_env("TOKEN_REAPER_BATCH_SIZE", 1000))
+# バッチ間の待機時間(秒)
+REAP_BATCH_SLEEP = float(get_env("TOKEN_REAPER_BATCH_SLEEP", 0.5))
+# 保持期間(秒)。監査用に残す場合は長くする
+TOKEN_RETENTION = int(get_env("LINK_TOKEN_RETENTION", 60 * 10))
+
+# ロガー
+LOGGER = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Sentry
+SENTRY_DSN = get_env("SENTRY_DSN", None)
+if SENTRY_DSN is not None:
+    sentry_sdk.init(dsn=SENTRY_DSN, traces_sample_rate=1.0)
+
+
+def reap() -> dict:
+    """期限切れのlink_request_tokensをバッチに分けて削除する"""
+    start = time.perf_counter()
+    expired_before = datetime.now(timezone.utc) - timedelta(seconds=TOKEN_RETENTION)
+
+    deleted = 0
+    batches = 0
+    with get_db() as db:
+        while True:
+            count = IOUtil.delete_expired_link_request_tokens(
+                db, expired_before, REAP_BATCH_SIZE
+            )
+            deleted += count
+            batches += 1
+
+            if count < REAP_BATCH_SIZE:
+                break
+
+            # 他の書き込みを妨げないよう間隔を空ける
+            time.sleep(REAP_BATCH_SLEEP)
+
+    report = {
+        "deleted": deleted,
+        "batches": batches,
+        "elapsed": round(time.perf_counter() - start, 3),
+    }
+    LOGGER.info(f"Token reaper completed: {report}")
+    return report
+
+
+def run_reap():
+    try:
+        reap()
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        LOGGER.error(f"Token reaper failed: {str(e)}")
+
+
+def main():
+    # 第1引数取得
+    arg1 = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if arg1 == "oneshot":
+        LOGGER.info("Running oneshot token reaper")
+        reap()
+        return
+
+    LOGGER.info(f"Scheduled token reaper every {REAP_INTERVAL} seconds")
+    while True:
+        run_reap()
+        time.sleep(REAP_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,21 @@
 import json
 import logging
+from contextlib import asynccontextmanager
 
 import sentry_sdk
 from fastapi import FastAPI, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
 
+from db.package.connection import async_engine
 from db.package.session import get_db
-from redis_crud import SessionCrud
-from redis_crud.schemas import SessionSchema
+from redis_crud import CACHE_DB, LazySession, SessionCrud, init_pool, close_pools
 from routers.system import main as system_router
 from routers.v1 import main as v1_router
 from util.env import get_env
+from util.link_index import LINK_INDEX_ENABLED, link_index
+from util.listeners import register_listeners
+from util.wd_auth_client import wd_auth_client
+from util.wikidot_client import wikidot_manager
 
 # get environment mode
 env_mode = get_env("ENV_MODE", "production")
@@ -49,8 +54,26 @@ elif env_mode == "production":
     app_params["redoc_url"] = None
     app_params["openapi_url"] = None
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # 共有リソースの初期化
+    init_pool(0)
+    init_pool(CACHE_DB)
+    register_listeners()
+    if LINK_INDEX_ENABLED:
+        link_index.start()
+    yield
+    # 共有リソースの解放
+    await link_index.stop()
+    close_pools()
+    await async_engine.dispose()
+    wikidot_manager.close()
+    await wd_auth_client.close()
+
+
 # create app
-app = FastAPI(**app_params)
+app = FastAPI(lifespan=lifespan, **app_params)
 
 origins = ["https://scp-jp.github.io", "https://localhost:3000"]
 
@@ -82,21 +105,25 @@ async def db_opener(request: Request, call_next, db=Depends(get_db)):
     return await call_next(request)
 
 
+# セッションを利用するブラウザ向けのパス
+SESSION_ENABLED_PATHS = {"/v1/auth", "/v1/callback"}
+
+
 @app.middleware("http")
 async def session_creator(request: Request, call_next):
+    # API・ヘルスチェックではセッションを扱わない
+    if request.url.path not in SESSION_ENABLED_PATHS:
+        return await call_next(request)
+
     with SessionCrud() as session_crud:
-        req_session_data = session_crud.get(request)
-        if req_session_data is None:
-            req_session_data = SessionSchema()
-        request.state.session = req_session_data
-        print(req_session_data)
+        # 初回アクセス時に読み込み、変更時のみ保存する
+        session = LazySession(session_crud, request)
+        request.state.session = session
 
-    response = await call_next(request)
+        response = await call_next(request)
 
-    with SessionCrud() as session_crud:
-        res_session_data = request.state.session
-        session_crud.update(request, response, res_session_data)
-        print(res_session_data)
+        # イベントループを止めないよう、Redisへの書き込みはスレッドで行う
+        await session.save_async(response)
     return response
 
 
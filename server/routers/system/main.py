@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 
 from .healthcheck import main as healthcheck_router
+from .stats import main as stats_router
 
 # define router
 router = APIRouter()
@@ -10,3 +11,7 @@ router.include_router(
     healthcheck_router.router,
     prefix="/healthcheck",
 )
+router.include_router(
+    stats_router.router,
+    prefix="/stats",
+)
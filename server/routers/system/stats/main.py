@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends
+from fastapi.security import HTTPBearer
+
+from db.package.connection import async_engine, engine
+from db.package.pool import get_pool_status
+from redis_crud import AccountCache, JobQueue, get_pool_stats
+from util.api_key import require_api_key
+from util.jp_member_queue import JP_MEMBER_QUEUE
+from util.link_index import link_index
+from util.wd_auth_client import wd_auth_client
+from util.wikidot_client import wikidot_manager
+
+# define bearer scheme
+bearer_scheme = HTTPBearer()
+
+# define router(内部の状態を返すため、v1と同じAPIキーを要求する)
+router = APIRouter(dependencies=[Depends(bearer_scheme), Depends(require_api_key)])
+
+
+# define route
+@router.get("/redis")
+async def redis_stats():
+    return {"pools": get_pool_stats()}
+
+
+@router.get("/db")
+async def db_stats():
+    return {
+        "sync": get_pool_status(engine.pool),
+        "async": get_pool_status(async_engine.pool),
+    }
+
+
+@router.get("/http")
+async def http_stats():
+    return {"wd_auth": wd_auth_client.stats.snapshot()}
+
+
+@router.get("/cache")
+def cache_stats():
+    with AccountCache() as cache:
+        return {
+            "account": cache.stats(),
+            "member_lookup": wikidot_manager.lookups.stats(),
+        }
+
+
+@router.get("/queue")
+def queue_stats():
+    with JobQueue(JP_MEMBER_QUEUE) as queue:
+        return {JP_MEMBER_QUEUE: queue.stats()}
+
+
+@router.get("/index")
+def index_stats():
+    return {"link_graph": link_index.stats()}
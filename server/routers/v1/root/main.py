@@ -1,27 +1,45 @@
 import base64
 import hashlib
+import json
 import secrets
 
 import httpx
-import wikidot
 from fastapi import (
     APIRouter,
     Request,
     Response,
     Depends,
     HTTPException,
+    Header,
     BackgroundTasks,
+    Query,
 )
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from db.package import schemas as defined_schemas
-from db.package.models import WikidotAccount
-from db.package.session import db_context, get_db
-from db.package.util import IOUtil
+from db.package.models import LinkChange
+from db.package.session import async_db_context, db_context, get_async_db, get_db
+from db.package.util import AsyncIOUtil, IOUtil
+from redis_crud import (
+    AccountCache,
+    DataVersion,
+    LinkTokenStore,
+    ListSnapshot,
+    subscribe_link_events,
+)
 from redis_crud.schemas import SessionAuthSchema
+from util.api_key import LINKER_API_KEY, check_api_key
 from util.env import get_env
+from util.jp_member_queue import enqueue_jp_member_check
+from util.link_index import link_index
+from util.list_snapshot import list_page_body, negotiate_encoding
+from util.wd_auth_client import wd_auth_client
+from util.wikidot_client import wikidot_manager
 
 # define router
 router = APIRouter()
@@ -31,12 +49,24 @@ bearer_scheme = HTTPBearer()
 
 templates = Jinja2Templates(directory="templates")
 
+# list系エンドポイントの1ページあたりの件数
+LIST_DEFAULT_LIMIT = 100
+LIST_MAX_LIMIT = 1000
+
+# エクスポートで1回に送る行数・サイズ(行ごとにスレッドプールを往復しないようまとめる)
+EXPORT_CHUNK_LINES = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# イベントストリームで通知がない時にコメント行を送る間隔(秒)
+EVENTS_KEEPALIVE_INTERVAL = float(get_env("EVENTS_KEEPALIVE_INTERVAL", "15"))
+
 # envs
-LINKER_API_KEY = get_env("LINKER_API_KEY", None)
 LINKER_SITE_URL = get_env("LINKER_SITE_URL", None)
 WD_AUTH_API_URL = get_env("WD_AUTH_API_URL", None)
 WD_AUTH_API_CLIENT_ID = get_env("WD_AUTH_API_CLIENT_ID", None)
 WD_AUTH_API_CLIENT_SECRET = get_env("WD_AUTH_API_CLIENT_SECRET", None)
+# 発行したトークンをPostgresにも記録するか
+LINK_TOKEN_AUDIT = get_env("LINK_TOKEN_AUDIT", "false").lower() == "true"
 
 if (
     LINKER_API_KEY is None
@@ -48,27 +78,6 @@ if (
     raise Exception("no environment variable")
 
 
-def check_api_key(request: Request):
-    if LINKER_API_KEY is None:
-        return False
-
-    # authorization header
-    auth = request.headers.get("Authorization")
-    if auth is None:
-        return False
-
-    # get bearer token
-    auth = auth.split(" ")
-    if len(auth) != 2:
-        return False
-
-    # check token
-    if auth[1] != LINKER_API_KEY:
-        return False
-
-    return True
-
-
 def create_code_challenge(code_verifier: str, code_challenge_method: str) -> str:
     if code_challenge_method == "plain":
         return code_verifier
@@ -88,28 +97,147 @@ def create_code_challenge(code_verifier: str, code_challenge_method: str) -> str
         raise ValueError("invalid code_challenge_method")
 
 
-def check_jp_member(
-    db: Session, client: wikidot.Client | None, user: WikidotAccount | int
-):
-    if client is None:
-        _client = wikidot.Client()
-    else:
-        _client = client
+async def audit_link_request_token(discord_account_id: int, token: str):
+    # レスポンス送信後に実行するため、リクエストとは別のセッションを使う
+    async with get_async_db() as _db:
+        await AsyncIOUtil.add_link_request_token(_db, discord_account_id, token)
+
+
+def json_bytes_response(body: str) -> Response:
+    # response_modelでの再検証・再シリアライズを行わずに返す
+    return Response(content=body.encode(), media_type="application/json")
 
-    if isinstance(user, int):
-        user = IOUtil.get_wikidot_account(db, user)
 
-    result = IOUtil.update_jp_member(db, _client, user)
+def data_version_etag() -> str:
+    with DataVersion() as version:
+        return f'W/"{version.get()}"'
 
-    if client is None:
-        del _client
 
-    return result
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 弱い比較(W/の有無は問わない)
+    return etag.removeprefix("W/") in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]
+
+
+def versioned_response(body: str, etag: str) -> Response:
+    response = json_bytes_response(body)
+    response.headers["ETag"] = etag
+    # キャッシュする場合も毎回ETagで再検証させる
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 
-def check_jp_member_in_background(user: WikidotAccount | int):
+def not_modified_response(etag: str) -> Response:
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
+
+
+def snapshot_response(request: Request, name: str, etag: str) -> Response | None:
+    """最新のスナップショットがあれば、エンコード済みの本文をそのまま返す"""
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    with ListSnapshot() as snapshot:
+        hit = snapshot.get(name, encoding)
+
+    # 書き込み後、再生成されるまではDBから組み立てる
+    if hit is None or f'W/"{hit[0]}"' != etag:
+        return None
+
+    response = Response(content=hit[1], media_type="application/json")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def link_change_schema(change: LinkChange) -> defined_schemas.LinkChangeSchema:
+    return defined_schemas.LinkChangeSchema(
+        id=change.id,
+        kind=change.kind,
+        discord_id=str(change.discord_id) if change.discord_id is not None else None,
+        wikidot_id=change.wikidot_id,
+        created_at=change.created_at,
+    )
+
+
+async def generate_link_events(request: Request, last_event_id: int | None):
+    # 取りこぼしを防ぐため、履歴を読む前に購読を始めておく
+    async with subscribe_link_events() as pubsub:
+        if last_event_id is None:
+            async with get_async_db() as _db:
+                last_event_id = await AsyncIOUtil.get_latest_link_change_id(_db)
+
+        while not await request.is_disconnected():
+            # 通知は起床の合図としてのみ使い、送る内容は変更履歴から読む
+            async with get_async_db() as _db:
+                changes = await AsyncIOUtil.get_link_changes(
+                    _db, last_event_id, LIST_MAX_LIMIT
+                )
+            for change in changes:
+                last_event_id = change.id
+                yield (
+                    f"id: {change.id}\n"
+                    f"event: {change.kind}\n"
+                    f"data: {link_change_schema(change).model_dump_json()}\n\n"
+                )
+            if len(changes) == LIST_MAX_LIMIT:
+                continue
+
+            message = await pubsub.get_message(timeout=EVENTS_KEEPALIVE_INTERVAL)
+            if message is None:
+                # 通知を取りこぼしていても、次の周回で履歴から拾える
+                yield ": keepalive\n\n"
+
+
+def link_graph_line(row) -> str:
+    return (
+        json.dumps(
+            {
+                "discord": {
+                    "id": str(row["discord_id"]),
+                    "username": row["discord_username"],
+                    "avatar": row["avatar"],
+                },
+                "wikidot": {
+                    "id": row["wikidot_id"],
+                    "username": row["wikidot_username"],
+                    "unixname": row["unixname"],
+                    "is_jp_member": row["is_jp_member"],
+                },
+                "created_at": row["created_at"],
+                "updated_at": row["updated_at"],
+                "unlinked_at": row["unlinked_at"],
+            },
+            ensure_ascii=False,
+            default=lambda o: o.isoformat(),
+        )
+        + "\n"
+    )
+
+
+def generate_link_graph_ndjson():
+    # レスポンス送信中もセッションを保持するため、generator内で開く
     with get_db() as _db:
-        return check_jp_member(_db, None, user)
+        chunk = []
+        size = 0
+        for row in IOUtil.iter_link_graph(_db):
+            line = link_graph_line(row)
+            chunk.append(line)
+            size += len(line)
+            if len(chunk) >= EXPORT_CHUNK_LINES or size >= EXPORT_CHUNK_BYTES:
+                yield "".join(chunk)
+                chunk = []
+                size = 0
+        if len(chunk) > 0:
+            yield "".join(chunk)
 
 
 # define route
@@ -122,16 +250,21 @@ async def flow_start(
     request: Request,
     response: Response,
     req_data: defined_schemas.FlowStartRequestSchema,
-    db: Session = Depends(db_context),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(async_db_context),
 ):
     if not check_api_key(request):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    # check request data
-    token = IOUtil.start_flow(db, req_data.discord)
+    # Discordアカウントのupsert(1文)
+    discord_account_id = await AsyncIOUtil.upsert_discord_account(db, req_data.discord)
 
-    if token is None:
-        raise HTTPException(status_code=400, detail="Bad Request")
+    # トークンはRedisに有効期限付きで保存する(再送時は未使用のトークンを再利用する)
+    with LinkTokenStore() as store:
+        token, reused = await run_in_threadpool(store.issue, int(req_data.discord.id))
+
+    if LINK_TOKEN_AUDIT and not reused:
+        background_tasks.add_task(audit_link_request_token, discord_account_id, token)
 
     return defined_schemas.FlowStartResponseSchema(
         url=f"{LINKER_SITE_URL}/v1/auth?token={token}"
@@ -139,11 +272,10 @@ async def flow_start(
 
 
 @router.get("/auth")
-def auth(
-    request: Request, response: Response, token: str, db: Session = Depends(db_context)
-):
-    discord_acc = IOUtil.get_discord_account_from_token(db, token)
-    if discord_acc is None:
+def auth(request: Request, response: Response, token: str):
+    with LinkTokenStore() as store:
+        discord_id = store.redeem(token)
+    if discord_id is None:
         return templates.TemplateResponse(
             "error.html",
             {"error_code": "invalid token", "request": request},
@@ -155,7 +287,7 @@ def auth(
     code_challenge_method = "S256"
 
     request.state.session.auth = SessionAuthSchema(
-        discord_id=discord_acc.discord_id,
+        discord_id=discord_id,
         code_verifier=code_verifier,
         code_challenge_method=code_challenge_method,
         state=token,
@@ -179,14 +311,16 @@ def auth(
 
 
 @router.get("/callback")
-def callback(
+async def callback(
     request: Request,
     response: Response,
     code: str,
     state: str,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(db_context),
+    db: AsyncSession = Depends(async_db_context),
 ):
+    # セッションの読み込み(Redis)でイベントループを止めない
+    await request.state.session.load_async()
+
     auth_data = request.state.session.auth
     if auth_data is None:
         return templates.TemplateResponse(
@@ -204,17 +338,25 @@ def callback(
         )
 
     # get info
-    userinfo_request = httpx.post(
-        f"{WD_AUTH_API_URL}/user",
-        json={
-            "client_id": WD_AUTH_API_CLIENT_ID,
-            "client_secret": WD_AUTH_API_CLIENT_SECRET,
-            "code": code,
-            "code_verifier": auth_data.code_verifier,
-            "grant_type": "authorization_code",
-            "redirect_uri": f"{LINKER_SITE_URL}/v1/callback",
-        },
-    )
+    try:
+        userinfo_request = await wd_auth_client.post(
+            f"{WD_AUTH_API_URL}/user",
+            json={
+                "client_id": WD_AUTH_API_CLIENT_ID,
+                "client_secret": WD_AUTH_API_CLIENT_SECRET,
+                "code": code,
+                "code_verifier": auth_data.code_verifier,
+                "grant_type": "authorization_code",
+                "redirect_uri": f"{LINKER_SITE_URL}/v1/callback",
+            },
+        )
+    except httpx.HTTPError:
+        request.state.session.auth = None
+        return templates.TemplateResponse(
+            "error.html",
+            {"error_code": "auth server unavailable", "request": request},
+            status_code=502,
+        )
 
     if userinfo_request.status_code != 200:
         request.state.session.auth = None
@@ -229,49 +371,35 @@ def callback(
         id=data["id"], username=data["name"], unixname=data["unix_name"]
     )
 
-    discord_account = IOUtil.get_discord_account(db, auth_data.discord_id)
     request.state.session.auth = None
 
-    if discord_account is None:
+    # Wikidotアカウントと連携を1文でupsertする
+    result = await AsyncIOUtil.link_accounts(db, auth_data.discord_id, wd_user)
+
+    if result is None:
         return templates.TemplateResponse(
             "error.html",
             {"error_code": "discord id not found", "request": request},
             status_code=400,
         )
 
-    wikidot_account = IOUtil.get_wikidot_account(db, wd_user.id)
-    if wikidot_account is None:
-        wikidot_account = IOUtil.create_wikidot_account(db, wd_user)
-    else:
-        wikidot_account = IOUtil.update_wikidot_account(db, wikidot_account, wd_user)
-
-    background_tasks.add_task(check_jp_member_in_background, wikidot_account.wikidot_id)
+    # JPメンバー判定はワーカーで行う
+    await run_in_threadpool(enqueue_jp_member_check, wd_user.id)
 
-    link = IOUtil.create_link(db, discord_account, wikidot_account)
-
-    if link is None:
-        return templates.TemplateResponse(
-            "success.html",
-            {
-                "message": "すでにアカウントが連携されています",
-                "discord_name": discord_account.username,
-                "discord_icon_url": discord_account.avatar,
-                "wikidot_name": wikidot_account.username,
-                "wikidot_icon_url": "https://www.wikidot.com/avatar.php?userid="
-                + str(wikidot_account.wikidot_id),
-                "request": request,
-            },
-        )
+    if result.link_inserted is None:
+        message = "すでにアカウントが連携されています"
+    else:
+        message = "アカウント連携が完了しました"
 
     return templates.TemplateResponse(
         "success.html",
         {
-            "message": "アカウント連携が完了しました",
-            "discord_name": discord_account.username,
-            "discord_icon_url": discord_account.avatar,
-            "wikidot_name": wikidot_account.username,
+            "message": message,
+            "discord_name": result.discord_username,
+            "discord_icon_url": result.discord_avatar,
+            "wikidot_name": wd_user.username,
             "wikidot_icon_url": "https://www.wikidot.com/avatar.php?userid="
-            + str(wikidot_account.wikidot_id),
+            + str(wd_user.id),
             "request": request,
         },
     )
@@ -286,35 +414,34 @@ async def flow_recheck(
     request: Request,
     response: Response,
     req_data: defined_schemas.FlowRecheckRequestSchema,
-    db: Session = Depends(db_context),
+    db: AsyncSession = Depends(async_db_context),
 ):
     if not check_api_key(request):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    discord_acc = IOUtil.get_discord_account(db, int(req_data.discord.id))
+    discord_acc = await AsyncIOUtil.get_discord_account(db, int(req_data.discord.id))
     if discord_acc is None:
         raise HTTPException(status_code=404, detail="Not Found")
 
     # discordアカウント情報更新
-    discord_acc = IOUtil.update_discord_account(db, discord_acc, req_data.discord)
+    discord_acc = await AsyncIOUtil.update_discord_account(
+        db, discord_acc, req_data.discord
+    )
 
-    # JPメンバ情報更新
+    # JPメンバ情報更新(並行して照会し、まとめて書き戻す)
     wikidot_acc = [a.wikidot for a in discord_acc.get_linked_accounts()]
 
-    # 結果格納用
-    results = []
-
-    with wikidot.Client() as client:
-        for acc in wikidot_acc:
-            _acc = check_jp_member(db, client, acc)
-            results.append(
-                defined_schemas.AccountResponseWikidotBaseSchema(
-                    id=_acc.wikidot_id,
-                    username=_acc.username,
-                    unixname=_acc.unixname,
-                    is_jp_member=_acc.is_jp_member,
-                )
-            )
+    wikidot_acc = await AsyncIOUtil.update_jp_members(db, wikidot_manager, wikidot_acc)
+
+    results = [
+        defined_schemas.AccountResponseWikidotBaseSchema(
+            id=_acc.wikidot_id,
+            username=_acc.username,
+            unixname=_acc.unixname,
+            is_jp_member=_acc.is_jp_member,
+        )
+        for _acc in wikidot_acc
+    ]
 
     return defined_schemas.FlowRecheckResponseSchema(
         discord=defined_schemas.DiscordAccountSchema(
@@ -341,30 +468,74 @@ def account_list(
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     discord_ids = [int(discord_id) for discord_id in req_data.discord_ids]
-    discord_accounts = IOUtil.get_some_discord_accounts(db, discord_ids)
 
-    results = [
-        defined_schemas.AccountResponseFromDiscordSchema(
-            discord=defined_schemas.DiscordAccountSchema(
-                id=str(discord_acc.discord_id),
-                username=discord_acc.username,
-                avatar=discord_acc.avatar,
-            ),
-            wikidot=[
-                defined_schemas.AccountResponseWikidotBaseSchema(
-                    id=a.wikidot.wikidot_id,
-                    username=a.wikidot.username,
-                    unixname=a.wikidot.unixname,
-                    is_jp_member=a.wikidot.is_jp_member,
+    # インメモリの索引が使えればDB・Redisを引かない
+    if link_index.ready:
+        items = {
+            str(discord_id): data
+            for discord_id, data in link_index.get_discord_accounts_json(
+                discord_ids
+            ).items()
+        }
+    else:
+        # DBを読む前のバージョン(読み込み中に書き込みがあればキャッシュしない)
+        with DataVersion() as version:
+            data_version = version.get()
+
+        with AccountCache() as cache:
+            # キャッシュにあるものはDBを引かない
+            items = {
+                str(discord_id): data.decode()
+                for discord_id, data in cache.get_many(discord_ids).items()
+            }
+
+            misses = [i for i in discord_ids if str(i) not in items]
+            if len(misses) > 0:
+                rows = IOUtil.get_some_discord_accounts_json(db, misses)
+                items.update({str(discord_id): data for discord_id, data, _ in rows})
+                cache.set_many(
+                    {
+                        discord_id: (data, wikidot_ids)
+                        for discord_id, data, wikidot_ids in rows
+                    },
+                    data_version,
                 )
-                for a in discord_acc.get_linked_accounts()
-            ],
-        )
-        for discord_acc in discord_accounts
-    ]
 
-    return defined_schemas.AccountListResponseSchema(
-        result={r.discord.id: r for r in results}
+    # 要素はシリアライズ済みのため、そのまま連結して返す
+    return json_bytes_response(
+        '{"result":{'
+        + ",".join(f"{json.dumps(k)}:{v}" for k, v in items.items())
+        + "}}"
+    )
+
+
+@router.post(
+    "/list/by-wikidot",
+    dependencies=[Depends(bearer_scheme)],
+    response_model=defined_schemas.AccountListByWikidotResponseSchema,
+)
+def account_list_by_wikidot(
+    request: Request,
+    response: Response,
+    req_data: defined_schemas.AccountListByWikidotRequestSchema,
+    db: Session = Depends(db_context),
+):
+    if not check_api_key(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    wikidot_ids = list(set(req_data.wikidot_ids))
+
+    # インメモリの索引が使えればDBを引かない
+    if link_index.ready:
+        rows = link_index.get_wikidot_accounts_json(wikidot_ids).items()
+    else:
+        rows = IOUtil.get_some_wikidot_accounts_json(db, wikidot_ids)
+
+    # 要素はシリアライズ済みのため、そのまま連結して返す
+    return json_bytes_response(
+        '{"result":{'
+        + ",".join(f'"{wikidot_id}":{data}' for wikidot_id, data in rows)
+        + "}}"
     )
 
 
@@ -374,37 +545,49 @@ def account_list(
     response_model=defined_schemas.ListDiscordResponseSchema,
 )
 def discord_account_list(
-    request: Request, response: Response, db: Session = Depends(db_context)
+    request: Request,
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=LIST_MAX_LIMIT),
+    after: int | None = None,
+    is_jp_member: bool | None = None,
+    has_active_link: bool | None = None,
+    full: bool = False,
+    db: Session = Depends(db_context),
 ):
     if not check_api_key(request):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    discord_accounts = IOUtil.get_discord_accounts(db)
-
-    result = []
-
-    for acc in discord_accounts:
-        result.append(
-            defined_schemas.ListDiscordItemSchema(
-                discord=defined_schemas.DiscordAccountSchema(
-                    id=str(acc.discord_id), username=acc.username, avatar=acc.avatar
-                ),
-                wikidot=[
-                    defined_schemas.WikidotAccountSchemaForManage(
-                        id=a.wikidot.wikidot_id,
-                        username=a.wikidot.username,
-                        unixname=a.wikidot.unixname,
-                        is_jp_member=a.wikidot.is_jp_member,
-                        unlinked_at=a.unlinked_at,
-                        created_at=a.created_at,
-                        updated_at=a.updated_at,
-                    )
-                    for a in acc.get_linked_accounts(include_unlinked=True)
-                ],
-            )
+    # 変更がなければDBを引かずに返す
+    etag = data_version_etag()
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    # 全件(limit・afterのどちらも指定がない場合も、従来どおり全件を返す)
+    if full or (limit is None and after is None):
+        if is_jp_member is None and has_active_link is None:
+            response = snapshot_response(request, "discord", etag)
+            if response is not None:
+                return response
+
+        rows = IOUtil.get_discord_accounts_json(
+            db, None, None, is_jp_member, has_active_link
+        )
+        return versioned_response(
+            list_page_body([data for _, data in rows], None), etag
         )
 
-    return defined_schemas.ListDiscordResponseSchema(result=result)
+    if limit is None:
+        limit = LIST_DEFAULT_LIMIT
+
+    # 次ページの有無を判定するため1件多く取得する
+    rows = IOUtil.get_discord_accounts_json(
+        db, limit + 1, after, is_jp_member, has_active_link
+    )
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+
+    return versioned_response(
+        list_page_body([data for _, data in rows[:limit]], next_cursor), etag
+    )
 
 
 @router.get(
@@ -413,39 +596,77 @@ def discord_account_list(
     response_model=defined_schemas.ListWikidotResponseSchema,
 )
 def wikidot_account_list(
-    request: Request, response: Response, db: Session = Depends(db_context)
+    request: Request,
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=LIST_MAX_LIMIT),
+    after: int | None = None,
+    is_jp_member: bool | None = None,
+    has_active_link: bool | None = None,
+    full: bool = False,
+    db: Session = Depends(db_context),
 ):
     if not check_api_key(request):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    wikidot_accounts = IOUtil.get_wikidot_accounts(db)
-
-    result = []
-
-    for acc in wikidot_accounts:
-        result.append(
-            defined_schemas.ListWikidotItemSchema(
-                discord=[
-                    defined_schemas.DiscordAccountSchemaForManage(
-                        id=str(a.discord.discord_id),
-                        username=a.discord.username,
-                        avatar=a.discord.avatar,
-                        unlinked_at=a.unlinked_at,
-                        created_at=a.created_at,
-                        updated_at=a.updated_at,
-                    )
-                    for a in acc.get_linked_accounts(include_unlinked=True)
-                ],
-                wikidot=defined_schemas.AccountResponseWikidotBaseSchema(
-                    id=acc.wikidot_id,
-                    username=acc.username,
-                    unixname=acc.unixname,
-                    is_jp_member=acc.is_jp_member,
-                ),
-            )
+    # 変更がなければDBを引かずに返す
+    etag = data_version_etag()
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    # 全件(limit・afterのどちらも指定がない場合も、従来どおり全件を返す)
+    if full or (limit is None and after is None):
+        if is_jp_member is None and has_active_link is None:
+            response = snapshot_response(request, "wikidot", etag)
+            if response is not None:
+                return response
+
+        rows = IOUtil.get_wikidot_accounts_json(
+            db, None, None, is_jp_member, has_active_link
+        )
+        return versioned_response(
+            list_page_body([data for _, data in rows], None), etag
         )
 
-    return defined_schemas.ListWikidotResponseSchema(result=result)
+    if limit is None:
+        limit = LIST_DEFAULT_LIMIT
+
+    # 次ページの有無を判定するため1件多く取得する
+    rows = IOUtil.get_wikidot_accounts_json(
+        db, limit + 1, after, is_jp_member, has_active_link
+    )
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+
+    return versioned_response(
+        list_page_body([data for _, data in rows[:limit]], next_cursor), etag
+    )
+
+
+@router.get(
+    "/list/changes",
+    dependencies=[Depends(bearer_scheme)],
+    response_model=defined_schemas.LinkChangesResponseSchema,
+)
+def link_change_list(
+    request: Request,
+    response: Response,
+    since: int = Query(0, ge=0),
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    db: Session = Depends(db_context),
+):
+    if not check_api_key(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    # 次ページの有無を判定するため1件多く取得する
+    changes = IOUtil.get_link_changes(db, since, limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    return defined_schemas.LinkChangesResponseSchema(
+        result=[link_change_schema(change) for change in changes],
+        # 変更がなければ同じカーソルで再度問い合わせる
+        next_cursor=changes[-1].id if len(changes) > 0 else since,
+        has_more=has_more,
+    )
 
 
 @router.patch("/unlink", dependencies=[Depends(bearer_scheme)])
@@ -478,3 +699,86 @@ def relink(
     result = IOUtil.relink(db, discord_id, wikidot_id)
 
     return defined_schemas.RelinkResponseSchema(result=result)
+
+
+def bulk_link_response(
+    pairs: list[defined_schemas.LinkPairSchema], changed: list[tuple[int, int]]
+) -> defined_schemas.BulkLinkResponseSchema:
+    changed = set(changed)
+    return defined_schemas.BulkLinkResponseSchema(
+        result=[
+            defined_schemas.BulkLinkResultSchema(
+                discord_id=pair.discord_id,
+                wikidot_id=pair.wikidot_id,
+                result=(pair.discord_id, pair.wikidot_id) in changed,
+            )
+            for pair in pairs
+        ]
+    )
+
+
+@router.patch(
+    "/unlink/bulk",
+    dependencies=[Depends(bearer_scheme)],
+    response_model=defined_schemas.BulkLinkResponseSchema,
+)
+async def bulk_unlink(
+    request: Request,
+    response: Response,
+    req_data: defined_schemas.BulkLinkRequestSchema,
+    db: AsyncSession = Depends(async_db_context),
+):
+    if not check_api_key(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    changed = await AsyncIOUtil.bulk_unlink(
+        db, [(pair.discord_id, pair.wikidot_id) for pair in req_data.pairs]
+    )
+
+    return bulk_link_response(req_data.pairs, changed)
+
+
+@router.patch(
+    "/relink/bulk",
+    dependencies=[Depends(bearer_scheme)],
+    response_model=defined_schemas.BulkLinkResponseSchema,
+)
+async def bulk_relink(
+    request: Request,
+    response: Response,
+    req_data: defined_schemas.BulkLinkRequestSchema,
+    db: AsyncSession = Depends(async_db_context),
+):
+    if not check_api_key(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    changed = await AsyncIOUtil.bulk_relink(
+        db, [(pair.discord_id, pair.wikidot_id) for pair in req_data.pairs]
+    )
+
+    return bulk_link_response(req_data.pairs, changed)
+
+
+@router.get("/export/links", dependencies=[Depends(bearer_scheme)])
+def export_links(request: Request):
+    if not check_api_key(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return StreamingResponse(
+        generate_link_graph_ndjson(), media_type="application/x-ndjson"
+    )
+
+
+@router.get("/events", dependencies=[Depends(bearer_scheme)])
+async def link_events(
+    request: Request,
+    last_event_id: int | None = Header(None, ge=0),
+):
+    if not check_api_key(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return StreamingResponse(
+        generate_link_events(request, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
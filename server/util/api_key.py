@@ -0,0 +1,32 @@
+from fastapi import HTTPException, Request
+
+from util.env import get_env
+
+LINKER_API_KEY = get_env("LINKER_API_KEY", None)
+
+
+def check_api_key(request: Request):
+    if LINKER_API_KEY is None:
+        return False
+
+    # authorization header
+    auth = request.headers.get("Authorization")
+    if auth is None:
+        return False
+
+    # get bearer token
+    auth = auth.split(" ")
+    if len(auth) != 2:
+        return False
+
+    # check token
+    if auth[1] != LINKER_API_KEY:
+        return False
+
+    return True
+
+
+def require_api_key(request: Request):
+    """ルーター全体に付けるdependency(APIキーがなければ401を返す)"""
+    if not check_api_key(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
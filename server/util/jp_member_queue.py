@@ -0,0 +1,10 @@
+from redis_crud import JobQueue
+
+# JPメンバー判定ジョブのキュー名
+JP_MEMBER_QUEUE = "jp_member"
+
+
+def enqueue_jp_member_check(wikidot_id: int) -> bool:
+    """JPメンバー判定をワーカーに依頼する(待機中の同じwikidot_idとはまとめられる)"""
+    with JobQueue(JP_MEMBER_QUEUE) as queue:
+        return queue.enqueue(wikidot_id)
@@ -0,0 +1,457 @@
+import asyncio
+import bisect
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+
+import asyncpg
+
+from db.package.connection import SQLALCHEMY_DATABASE_URL
+from db.package.session import get_async_db
+from db.package.util import AsyncIOUtil
+from util.env import get_env
+
+logger = logging.getLogger(__name__)
+
+# 有効にした場合のみ、起動時に読み込んでメモリ上から返す
+LINK_INDEX_ENABLED = get_env("LINK_INDEX_ENABLED", "false").lower() == "true"
+# LISTEN用の接続が切れた後、再接続するまでの待ち時間(秒)
+LINK_INDEX_RETRY_INTERVAL = float(get_env("LINK_INDEX_RETRY_INTERVAL", 5))
+# LISTEN用の接続が生きているかを確認する間隔・待ち時間(秒)
+# (切断を通知されないまま接続が止まった場合も、再接続して読み込み直す)
+LINK_INDEX_HEALTH_CHECK_INTERVAL = float(
+    get_env("LINK_INDEX_HEALTH_CHECK_INTERVAL", 30)
+)
+LINK_INDEX_HEALTH_CHECK_TIMEOUT = float(get_env("LINK_INDEX_HEALTH_CHECK_TIMEOUT", 5))
+
+# notify_link_graph()トリガーの通知チャンネル
+LINK_GRAPH_CHANNEL = "link_graph"
+
+
+class _Discord:
+    __slots__ = ("discord_id", "username", "avatar")
+
+    def __init__(self, discord_id: int, username: str, avatar: str | None):
+        self.discord_id = discord_id
+        self.username = username
+        self.avatar = avatar
+
+
+class _Wikidot:
+    __slots__ = ("wikidot_id", "username", "unixname", "is_jp_member")
+
+    def __init__(self, wikidot_id: int, username: str, unixname: str, is_jp_member):
+        self.wikidot_id = wikidot_id
+        self.username = username
+        self.unixname = unixname
+        self.is_jp_member = is_jp_member
+
+
+class _Link:
+    __slots__ = ("id", "discord_id", "wikidot_id", "active")
+
+    def __init__(self, id: int, discord_id: int, wikidot_id: int, active: bool):
+        self.id = id
+        self.discord_id = discord_id
+        self.wikidot_id = wikidot_id
+        self.active = active
+
+
+def _link_id(link: _Link) -> int:
+    return link.id
+
+
+def _discord_bytes(acc: _Discord) -> int:
+    return sys.getsizeof(acc) + sys.getsizeof(acc.username) + sys.getsizeof(acc.avatar)
+
+
+def _wikidot_bytes(acc: _Wikidot) -> int:
+    return (
+        sys.getsizeof(acc) + sys.getsizeof(acc.username) + sys.getsizeof(acc.unixname)
+    )
+
+
+# 連携1件あたり(オブジェクトと、2つの隣接リストからの参照)
+_LINK_BYTES = sys.getsizeof(_Link(0, 0, 0, True)) + 2 * 8
+_EMPTY_LIST_BYTES = sys.getsizeof([])
+
+
+class _Graph:
+    """アカウントと、アカウントごとの連携の隣接リスト(連携のid順)"""
+
+    def __init__(self):
+        self.discord: dict[int, _Discord] = {}
+        self.wikidot: dict[int, _Wikidot] = {}
+        self.links: dict[int, _Link] = {}
+        self.discord_links: dict[int, list[_Link]] = {}
+        self.wikidot_links: dict[int, list[_Link]] = {}
+        # 保持しているオブジェクトのバイト数(追加・削除のたびに更新する)
+        self.object_bytes = 0
+
+    @staticmethod
+    def _insert(adjacency: dict[int, list[_Link]], key: int, link: _Link):
+        bisect.insort(adjacency.setdefault(key, []), link, key=_link_id)
+
+    @staticmethod
+    def _remove(adjacency: dict[int, list[_Link]], key: int, link: _Link):
+        links = adjacency.get(key)
+        if links is None:
+            return
+        links.remove(link)
+        if len(links) == 0:
+            del adjacency[key]
+
+    def put_discord(self, row: dict):
+        acc = _Discord(row["discord_id"], row["username"], row["avatar"])
+        old = self.discord.get(acc.discord_id)
+        if old is not None:
+            self.object_bytes -= _discord_bytes(old)
+        self.discord[acc.discord_id] = acc
+        self.object_bytes += _discord_bytes(acc)
+
+    def put_wikidot(self, row: dict):
+        acc = _Wikidot(
+            row["wikidot_id"], row["username"], row["unixname"], row["is_jp_member"]
+        )
+        old = self.wikidot.get(acc.wikidot_id)
+        if old is not None:
+            self.object_bytes -= _wikidot_bytes(old)
+        self.wikidot[acc.wikidot_id] = acc
+        self.object_bytes += _wikidot_bytes(acc)
+
+    def put_link(self, row: dict):
+        self.delete_link(row["id"])
+        link = _Link(
+            row["id"], row["discord_id"], row["wikidot_id"], row["unlinked_at"] is None
+        )
+        self.links[link.id] = link
+        self.object_bytes += _LINK_BYTES
+        self._insert(self.discord_links, link.discord_id, link)
+        self._insert(self.wikidot_links, link.wikidot_id, link)
+
+    def delete_link(self, link_id: int):
+        link = self.links.pop(link_id, None)
+        if link is None:
+            return
+        self.object_bytes -= _LINK_BYTES
+        self._remove(self.discord_links, link.discord_id, link)
+        self._remove(self.wikidot_links, link.wikidot_id, link)
+
+    def delete_discord(self, discord_id: int):
+        acc = self.discord.pop(discord_id, None)
+        if acc is not None:
+            self.object_bytes -= _discord_bytes(acc)
+        # 連携はON DELETE CASCADEで消える(その通知も届く)が、先に外しておく
+        for link in list(self.discord_links.get(discord_id, [])):
+            self.delete_link(link.id)
+
+    def delete_wikidot(self, wikidot_id: int):
+        acc = self.wikidot.pop(wikidot_id, None)
+        if acc is not None:
+            self.object_bytes -= _wikidot_bytes(acc)
+        for link in list(self.wikidot_links.get(wikidot_id, [])):
+            self.delete_link(link.id)
+
+    def apply(self, event: dict):
+        table, op, row = event["table"], event["op"], event["row"]
+        if table == "discord_accounts":
+            if op == "DELETE":
+                self.delete_discord(row["discord_id"])
+            else:
+                self.put_discord(row)
+        elif table == "wikidot_accounts":
+            if op == "DELETE":
+                self.delete_wikidot(row["wikidot_id"])
+            else:
+                self.put_wikidot(row)
+        elif table == "linked_accounts":
+            if op == "DELETE":
+                self.delete_link(row["id"])
+            else:
+                self.put_link(row)
+
+    def memory_bytes(self) -> int:
+        """索引が保持しているオブジェクトのおおよそのバイト数(件数によらず一定の時間で返す)"""
+        size = self.object_bytes
+        for objects in (self.discord, self.wikidot, self.links):
+            size += sys.getsizeof(objects)
+        for adjacency in (self.discord_links, self.wikidot_links):
+            # 隣接リストの要素分は連携ごとに数えているため、リスト本体のみ
+            size += sys.getsizeof(adjacency) + len(adjacency) * _EMPTY_LIST_BYTES
+        return size
+
+
+class LinkGraphIndex:
+    """
+    Discord・Wikidotアカウントと連携のインメモリ索引
+
+    起動時に全件を読み込み、以降はPostgresのNOTIFY(notify_link_graph()トリガー)で
+    差分を反映する。LISTENの接続が切れている間はreadyがFalseになり、呼び出し側はDBを使う
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        retry_interval: float,
+        health_check_interval: float,
+        health_check_timeout: float,
+    ):
+        self.dsn = dsn
+        self.retry_interval = retry_interval
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+
+        # 参照はthreadpoolのルートから、更新は適用用のスレッドから行う
+        # (ロックを待つ可能性があるため、イベントループでは取らない)
+        self._lock = threading.Lock()
+        self._graph = _Graph()
+        self._ready = False
+        # イベントループから適用用のスレッドへ渡す処理(届いた順に処理する)
+        self._queue: queue.SimpleQueue[tuple[str, object] | None] = queue.SimpleQueue()
+        self._applier: threading.Thread | None = None
+        # 読み込み中に届いた通知(読み込み後に順に適用する。適用用のスレッドのみが触る)
+        self._pending: list[dict] | None = None
+
+        self._task: asyncio.Task | None = None
+        self._loaded_at: float | None = None
+        self._last_event_at: float | None = None
+        self._last_event_lag: float | None = None
+        self._events = 0
+        self._reloads = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def start(self):
+        if self._applier is None:
+            self._applier = threading.Thread(
+                target=self._apply_loop, name="link-index-applier", daemon=True
+            )
+            self._applier.start()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._applier is not None:
+            self._queue.put(None)
+            self._applier = None
+        self._ready = False
+
+    async def _run(self):
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"link graph index failed: {e}")
+            self._ready = False
+            await asyncio.sleep(self.retry_interval)
+
+    async def _listen(self):
+        conn = await asyncpg.connect(self.dsn)
+        closed = asyncio.Event()
+        conn.add_termination_listener(lambda _conn: closed.set())
+        try:
+            # 取りこぼしを防ぐため、読み込みの前にLISTENを始めておく
+            self._queue.put(("listen", None))
+            await conn.add_listener(LINK_GRAPH_CHANNEL, self._on_notify)
+            await self._load()
+            await self._wait_closed(conn, closed)
+        finally:
+            # 再接続して読み込み直すまでは、呼び出し側にDBを使わせる
+            # (適用待ちの読み込み結果がreadyに戻しても、続くclosedで戻す)
+            self._ready = False
+            self._queue.put(("closed", None))
+            await conn.close()
+
+    async def _wait_closed(self, conn: asyncpg.Connection, closed: asyncio.Event):
+        """接続が閉じるか、確認のクエリが失敗・タイムアウトするまで待つ"""
+        while not closed.is_set():
+            try:
+                await asyncio.wait_for(
+                    closed.wait(), timeout=self.health_check_interval
+                )
+            except TimeoutError:
+                try:
+                    await asyncio.wait_for(
+                        conn.fetchval("SELECT 1"), timeout=self.health_check_timeout
+                    )
+                except TimeoutError:
+                    # 応答しない接続は閉じるのを待たずに切る
+                    conn.terminate()
+                    raise ConnectionError("LISTEN connection health check timed out")
+
+    async def _load(self):
+        start = time.perf_counter()
+        async with get_async_db() as _db:
+            discord, wikidot, links = await AsyncIOUtil.get_link_graph_tables(_db)
+
+        graph = await asyncio.to_thread(self._build, discord, wikidot, links)
+        # 読み込み中に届いた通知を適用してから差し替える(適用用のスレッドで行う)
+        self._queue.put(("swap", (graph, start)))
+
+    @staticmethod
+    def _build(discord: list, wikidot: list, links: list) -> _Graph:
+        graph = _Graph()
+        for row in discord:
+            graph.put_discord(row._mapping)
+        for row in wikidot:
+            graph.put_wikidot(row._mapping)
+        for row in links:
+            graph.put_link(row._mapping)
+        return graph
+
+    def _on_notify(self, _conn, _pid, _channel, payload: str):
+        # イベントループ上ではロックを取らず、適用用のスレッドへ渡すだけにする
+        self._queue.put(("event", payload))
+
+    def _apply_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._apply(*item)
+            except Exception as e:
+                logger.error(f"link graph index failed to apply {item[0]}: {e}")
+
+    def _apply(self, kind: str, value):
+        if kind == "listen":
+            self._pending = []
+        elif kind == "closed":
+            self._pending = None
+            self._ready = False
+        elif kind == "event":
+            event = json.loads(value)
+            if self._pending is not None:
+                self._pending.append(event)
+                return
+            with self._lock:
+                self._graph.apply(event)
+                self._events += 1
+                self._last_event_at = time.time()
+                self._last_event_lag = self._last_event_at - event["at"]
+        elif kind == "swap":
+            graph, start = value
+            # 差し替え前のグラフは他から参照されないため、ロックの外で適用する
+            for event in self._pending or []:
+                graph.apply(event)
+            self._pending = None
+            with self._lock:
+                self._graph = graph
+                self._ready = True
+                self._loaded_at = time.time()
+                self._reloads += 1
+
+            logger.info(
+                f"link graph index loaded: {len(graph.discord)} discord, "
+                f"{len(graph.wikidot)} wikidot, {len(graph.links)} links "
+                f"in {time.perf_counter() - start:.3f}s"
+            )
+
+    def get_discord_accounts_json(self, discord_ids: list[int]) -> dict[int, str]:
+        """discord_id -> AccountResponseFromDiscordSchema相当のJSON文字列"""
+        result = {}
+        with self._lock:
+            graph = self._graph
+            for discord_id in discord_ids:
+                acc = graph.discord.get(discord_id)
+                if acc is None:
+                    continue
+                wikidot = []
+                for link in graph.discord_links.get(discord_id, []):
+                    w = graph.wikidot.get(link.wikidot_id)
+                    if link.active and w is not None:
+                        wikidot.append(
+                            {
+                                "id": w.wikidot_id,
+                                "username": w.username,
+                                "unixname": w.unixname,
+                                "is_jp_member": w.is_jp_member,
+                            }
+                        )
+                result[discord_id] = {
+                    "discord": {
+                        "id": str(acc.discord_id),
+                        "username": acc.username,
+                        "avatar": acc.avatar,
+                    },
+                    "wikidot": wikidot,
+                }
+        return {k: json.dumps(v, ensure_ascii=False) for k, v in result.items()}
+
+    def get_wikidot_accounts_json(self, wikidot_ids: list[int]) -> dict[int, str]:
+        """wikidot_id -> AccountResponseFromWikidotSchema相当のJSON文字列"""
+        result = {}
+        with self._lock:
+            graph = self._graph
+            for wikidot_id in wikidot_ids:
+                acc = graph.wikidot.get(wikidot_id)
+                if acc is None:
+                    continue
+                discord = []
+                for link in graph.wikidot_links.get(wikidot_id, []):
+                    d = graph.discord.get(link.discord_id)
+                    if link.active and d is not None:
+                        discord.append(
+                            {
+                                "id": str(d.discord_id),
+                                "username": d.username,
+                                "avatar": d.avatar,
+                            }
+                        )
+                result[wikidot_id] = {
+                    "discord": discord,
+                    "wikidot": {
+                        "id": acc.wikidot_id,
+                        "username": acc.username,
+                        "unixname": acc.unixname,
+                        "is_jp_member": acc.is_jp_member,
+                    },
+                }
+        return {k: json.dumps(v, ensure_ascii=False) for k, v in result.items()}
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            graph = self._graph
+            return {
+                "enabled": self._task is not None,
+                "ready": self._ready,
+                "discord_accounts": len(graph.discord),
+                "wikidot_accounts": len(graph.wikidot),
+                "links": len(graph.links),
+                "memory_bytes": graph.memory_bytes(),
+                "reloads": self._reloads,
+                "events": self._events,
+                "seconds_since_load": (
+                    now - self._loaded_at if self._loaded_at is not None else None
+                ),
+                "seconds_since_last_event": (
+                    now - self._last_event_at
+                    if self._last_event_at is not None
+                    else None
+                ),
+                # 最後の通知について、書き込みから反映までにかかった秒数
+                "last_event_lag": self._last_event_lag,
+            }
+
+
+link_index = LinkGraphIndex(
+    dsn=SQLALCHEMY_DATABASE_URL,
+    retry_interval=LINK_INDEX_RETRY_INTERVAL,
+    health_check_interval=LINK_INDEX_HEALTH_CHECK_INTERVAL,
+    health_check_timeout=LINK_INDEX_HEALTH_CHECK_TIMEOUT,
+)
@@ -0,0 +1,54 @@
+import gzip
+import json
+
+import brotli
+
+from db.package.util import IOUtil
+
+# スナップショットを作るlist(名前 -> (id, JSON文字列)のリストを返す関数)
+SNAPSHOT_LISTS = {
+    "discord": IOUtil.get_discord_accounts_json,
+    "wikidot": IOUtil.get_wikidot_accounts_json,
+}
+
+# 優先順(identityは常に提供する)
+SNAPSHOT_ENCODINGS = ["br", "gzip"]
+
+
+def list_page_body(items: list[str], next_cursor: int | None) -> str:
+    return (
+        '{"result":['
+        + ",".join(items)
+        + '],"next_cursor":'
+        + json.dumps(next_cursor)
+        + "}"
+    )
+
+
+def encode_snapshot(body: str) -> dict[str, bytes]:
+    """エンコーディングごとの本文を作る"""
+    raw = body.encode()
+    return {
+        "identity": raw,
+        "gzip": gzip.compress(raw, compresslevel=9),
+        "br": brotli.compress(raw, quality=11),
+    }
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str:
+    """Accept-Encodingから、提供できる中で最も優先するエンコーディングを選ぶ"""
+    if accept_encoding is None:
+        return "identity"
+
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if params in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+
+    for encoding in SNAPSHOT_ENCODINGS:
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return "identity"
@@ -0,0 +1,32 @@
+from db.package.events import add_change_listener
+from redis_crud import AccountCache, DataVersion, LinkEventPublisher
+
+_registered = False
+
+
+def invalidate_account_cache(kind: str, discord_ids: list[int], wikidot_ids: list[int]):
+    with AccountCache() as cache:
+        cache.invalidate(discord_ids, wikidot_ids)
+
+
+def bump_data_version(kind: str, discord_ids: list[int], wikidot_ids: list[int]):
+    with DataVersion() as version:
+        version.bump()
+
+
+def publish_link_event(kind: str, discord_ids: list[int], wikidot_ids: list[int]):
+    with LinkEventPublisher() as publisher:
+        publisher.publish(kind, discord_ids, wikidot_ids)
+
+
+def register_listeners():
+    """DBの変更通知を受け取るリスナーを登録する(プロセスごとに1回)"""
+    global _registered
+    if _registered:
+        return
+    _registered = True
+
+    # 古い値でキャッシュを埋めないよう、無効化より先にバージョンを上げる
+    add_change_listener(bump_data_version)
+    add_change_listener(invalidate_account_cache)
+    add_change_listener(publish_link_event)
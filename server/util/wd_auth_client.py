@@ -0,0 +1,64 @@
+import time
+
+import httpx
+
+from db.package.histogram import LatencyHistogram
+from util.env import get_env
+
+
+class WDAuthClientManager:
+    """
+    WD認証APIとの通信に使う、アプリ全体で共有する非同期HTTPクライアント
+
+    接続をkeep-aliveで使い回し(対応していればHTTP/2)、
+    トークン交換1回ごとの所要時間を集計する
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float,
+        read_timeout: float,
+        max_connections: int,
+        max_keepalive_connections: int,
+    ):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        # プールのチェックアウト待ちと同じ形式で集計する
+        self.stats = LatencyHistogram()
+
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # イベントループ上でのみ使うためロックは不要
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=True, timeout=self.timeout, limits=self.limits
+            )
+        return self._client
+
+    async def post(self, url: str, json: dict) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(url, json=json)
+        except httpx.TimeoutException:
+            self.stats.observe(0, timed_out=True)
+            raise
+        self.stats.observe((time.perf_counter() - start) * 1000)
+        return response
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+wd_auth_client = WDAuthClientManager(
+    connect_timeout=float(get_env("WD_AUTH_API_CONNECT_TIMEOUT", 5)),
+    read_timeout=float(get_env("WD_AUTH_API_READ_TIMEOUT", 10)),
+    max_connections=int(get_env("WD_AUTH_API_MAX_CONNECTIONS", 20)),
+    max_keepalive_connections=int(get_env("WD_AUTH_API_MAX_KEEPALIVE", 10)),
+)
@@ -0,0 +1,141 @@
+import threading
+import time
+
+import httpx
+import wikidot
+
+from redis_crud import SingleFlight
+from util.env import get_env
+
+# wikidot.Site.member_lookup(QuickModule.member_lookup)が照会する先
+QUICKMODULE_URL = "https://www.wikidot.com/quickmodule.php"
+
+
+class WikidotClientManager:
+    """
+    プロセス全体で共有するWikidotクライアント
+
+    wikidot.Clientとサイト情報(TTL付き)を使い回し、
+    メンバー照会はkeep-aliveされたHTTPクライアントで行い、
+    同じユーザーへの同時照会は1回にまとめる
+    """
+
+    def __init__(
+        self, site_name: str, site_ttl: int, timeout: float, lookups: SingleFlight
+    ):
+        self.site_name = site_name
+        self.site_ttl = site_ttl
+        self.timeout = timeout
+        self.lookups = lookups
+
+        self._lock = threading.Lock()
+        # サイト情報の取得し直しを1スレッドに限る
+        self._site_lock = threading.Lock()
+        self._client: wikidot.Client | None = None
+        self._http: httpx.Client | None = None
+        self._site: wikidot.Site | None = None
+        self._site_fetched_at = 0.0
+
+    @property
+    def client(self) -> wikidot.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = wikidot.Client()
+            return self._client
+
+    @property
+    def http(self) -> httpx.Client:
+        with self._lock:
+            if self._http is None:
+                self._http = httpx.Client(timeout=self.timeout)
+            return self._http
+
+    def _cached_site(self) -> wikidot.Site | None:
+        site = self._site
+        if (
+            site is not None
+            and time.monotonic() - self._site_fetched_at < self.site_ttl
+        ):
+            return site
+        return None
+
+    def get_site(self) -> wikidot.Site:
+        """サイト情報を返す(TTLを過ぎていたら取得し直す)"""
+        site = self._cached_site()
+        if site is not None:
+            return site
+
+        # 同時に期限切れを見つけたスレッドは、最初の1つの取得結果を待って使う
+        with self._site_lock:
+            site = self._cached_site()
+            if site is not None:
+                return site
+
+            site = self.client.site.get(self.site_name)
+            with self._lock:
+                self._site = site
+                self._site_fetched_at = time.monotonic()
+            return site
+
+    def member_lookup(self, user_name: str, user_id: int | None = None) -> bool:
+        """wikidot.Site.member_lookupと同じ判定を行う(同時照会・直近の結果は共有する)"""
+        key = f"{self.site_name}:{user_id if user_id is not None else user_name}"
+        return self.lookups.do(key, lambda: self._member_lookup(user_name, user_id))
+
+    def _member_lookup(self, user_name: str, user_id: int | None = None) -> bool:
+        """
+        wikidot.Site.member_lookupと同じ照会・判定を、接続を使い回して行う
+
+        ライブラリの実装は照会ごとにhttpx.getで接続し直すため、
+        同じリクエストをkeep-aliveされたクライアントから送る
+        """
+        response = self.http.get(
+            QUICKMODULE_URL,
+            params={
+                "module": "MemberLookupQModule",
+                "s": self.get_site().id,
+                "q": user_name,
+            },
+        )
+        if response.status_code == httpx.codes.INTERNAL_SERVER_ERROR:
+            raise ValueError("Site is not found")
+        response.raise_for_status()
+
+        users = response.json()["users"]
+        if users is False:
+            return False
+
+        return any(
+            user["name"].strip() == user_name
+            and (user_id is None or int(user["user_id"]) == user_id)
+            for user in users
+        )
+
+    def get_member_ids(self) -> set[int]:
+        """サイトの全メンバーのユーザーIDを取得する(ページは並列に取得される)"""
+        # Site.membersは結果をSiteオブジェクトにキャッシュするため、直接取得する
+        members = wikidot.SiteMember.get(self.get_site())
+        return {member.user.id for member in members}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.__exit__(None, None, None)
+                self._client = None
+            if self._http is not None:
+                self._http.close()
+                self._http = None
+            self._site = None
+
+
+wikidot_manager = WikidotClientManager(
+    site_name=get_env("WIKIDOT_SITE_NAME", "scp-jp"),
+    site_ttl=int(get_env("WIKIDOT_SITE_CACHE_TTL", 60 * 60)),
+    timeout=float(get_env("WIKIDOT_REQUEST_TIMEOUT", 30)),
+    lookups=SingleFlight(
+        "member_lookup",
+        result_ttl=float(get_env("MEMBER_LOOKUP_CACHE_TTL", 30)),
+        lock_ttl=float(get_env("MEMBER_LOOKUP_LOCK_TTL", 30)),
+        wait_timeout=float(get_env("MEMBER_LOOKUP_WAIT_TIMEOUT", 60)),
+    ),
+)